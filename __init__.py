@@ -1,5 +1,5 @@
 __all__ = ['countdown', 'imagelib', 'pandas_ext', 'plots', 'sound', 
-           'timer', 'user_interaction','utils']
+           'timer', 'user_interaction','utils', 'video_probe']
 
 from . import countdown
 from . import imagelib
@@ -9,6 +9,7 @@ from . import sound
 from . import timer
 from . import user_interaction
 from . import utils
+from . import video_probe
 
 
 
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import time
+import threading
+import asyncio
 import numpy as np
 from . import sound
 
+def _beepDurations(nTicks, beepDuration, incrDurationFlag):
+    if incrDurationFlag:
+        return np.linspace(0.1, 0.9, nTicks)
+    return [beepDuration]*nTicks
+
 class Countdown:
     
     def __init__(self, seconds=10, outputUpdate=1, beepFreq=1000, beepDuration=0.5, 
@@ -21,23 +28,172 @@ class Countdown:
             self.start()
     
     def start(self):
-        if self.incrDurationFlag:
-            beepDurations = np.linspace(0.1, 0.9, int(np.ceil(self.seconds/self.outputUpdate)))
-        else:
-            beepDurations = [self.beepDuration]*int(np.ceil(self.seconds/self.outputUpdate))
-                                        
-        for i, bd in zip(range(0, self.seconds, self.outputUpdate), beepDurations):
-            if self.printOutFlag:
-                print(self.seconds - i)
-            if self.audioOutFlag:
-                sound.playBeep(self.beepFreq, bd, blockExec = False)
-            time.sleep(min(self.outputUpdate, self.seconds-i))
-        
+        # blocks until the end, the ticks are scheduled without drift
+        scheduler = CountdownScheduler(self.seconds, self.outputUpdate, self.beepFreq, 
+            self.beepDuration, self.incrDurationFlag, self.printOutFlag, 
+            self.audioOutFlag)
+        scheduler.wait()
+
+class CountdownScheduler:
+    '''
+    Countdown running on a background thread, so that the caller can keep 
+    working (ex. acquiring data) while it goes on.
+
+    Every tick is scheduled at a fixed time from the start, measured with 
+    time.monotonic, so the time spent printing, beeping or in the callbacks 
+    doesn't accumulate: the last tick is always at seconds from the start. 
+    The beeps are played on the beep worker of sound (sound.playBeepQueued) 
+    instead of a new thread for each one.
+
+    Parameters
+    ----------
+    seconds : float, optional
+        duration of the countdown. The default is 10.
+    outputUpdate : float, optional
+        time between two ticks. The default is 1.
+    beepFreq : int, optional
+        frequency of the beeps. The final beep is at beepFreq/2. The default is 1000.
+    beepDuration : float, optional
+        duration of the beeps if not incrDurationFlag. The default is 0.5.
+    incrDurationFlag : bool, optional
+        if True, the beep durations increase from 0.1 to 0.9 s. The default is True.
+    printOutFlag : bool, optional
+        prints the remaining seconds at every tick. The default is True.
+    audioOutFlag : bool, optional
+        beeps at every tick. The default is True.
+    onTick : callable, optional
+        called as onTick(remaining) at every tick, remaining is 0 at the end. 
+        The default is None.
+    onEnd : callable, optional
+        called when the countdown reaches 0 (not if cancelled). The default is None.
+    start : bool, optional
+        automatically start the countdown. The default is True.
+
+    Methods
+    -------
+    start
+        starts the countdown
+
+    cancel
+        stops the countdown before the next tick
+
+    wait
+        blocks until the end of the countdown
+    '''
+
+    def __init__(self, seconds=10, outputUpdate=1, beepFreq=1000, beepDuration=0.5, 
+                 incrDurationFlag=True, printOutFlag=True, audioOutFlag=True, 
+                 onTick=None, onEnd=None, start=True):
+        self.seconds = seconds
+        self.outputUpdate = outputUpdate
+        self.beepFreq = beepFreq
+        self.beepDuration = beepDuration
+        self.incrDurationFlag = incrDurationFlag
+        self.printOutFlag = printOutFlag
+        self.audioOutFlag = audioOutFlag
+        self.onTick = onTick
+        self.onEnd = onEnd
+
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+        self._thread = None
+        self.startTime = None
+
+        if start:
+            self.start()
+
+    def ticks(self):
+        '''List of (time from the start, remaining seconds, beep duration) 
+        of the ticks, the last one is the end of the countdown'''
+        nTicks = int(np.ceil(self.seconds/self.outputUpdate))
+        beepDurations = _beepDurations(nTicks, self.beepDuration, self.incrDurationFlag)
+        ticks = [(i*self.outputUpdate, self.seconds - i*self.outputUpdate, bd) 
+                 for i, bd in zip(range(nTicks), beepDurations)]
+        ticks.append((self.seconds, 0, max(1, self.beepDuration*2)))
+        return ticks
+
+    def start(self):
+        '''Starts the countdown on a background thread'''
+        if self._thread is not None:
+            raise Exception('countdown already started')
+        self.startTime = time.monotonic()
+        self._thread = threading.Thread(target = self._run, daemon = True)
+        self._thread.start()
+
+    def cancel(self):
+        '''Stops the countdown before the next tick'''
+        self._cancelled.set()
+
+    def wait(self, timeout = None):
+        '''Blocks until the end (or the cancellation) of the countdown, 
+        returns True if the countdown reached 0'''
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return self._finished.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def done(self):
+        return self._finished.is_set() or self._cancelled.is_set()
+
+    def _run(self):
+        for delay, remaining, beepDuration in self.ticks():
+            # wait until the deadline of this tick, or the cancellation
+            if self._cancelled.wait(max(0, self.startTime + delay - time.monotonic())):
+                return
+            self._tick(remaining, beepDuration)
+        self._finished.set()
+        if self.onEnd is not None:
+            self.onEnd()
+
+    def _tick(self, remaining, beepDuration):
         if self.printOutFlag:
-            print(0)
+            print(remaining)
         if self.audioOutFlag:
-            sound.playBeep(self.beepFreq/2, max(1,self.beepDuration*2), blockExec = False)
-            
-        
-        
-    
\ No newline at end of file
+            freq = self.beepFreq if remaining else self.beepFreq/2
+            sound.playBeepQueued(freq, beepDuration)
+        if self.onTick is not None:
+            self.onTick(remaining)
+
+async def countdownTicks(seconds=10, outputUpdate=1, beepFreq=1000, beepDuration=0.5, 
+                         incrDurationFlag=True, printOutFlag=True, audioOutFlag=True):
+    '''
+    asyncio version of CountdownScheduler: asynchronous generator yielding 
+    the remaining seconds at every tick (0 at the end), scheduled without drift 
+    on the clock of the event loop. The beeps are played on the shared sound 
+    worker, so the event loop is never blocked.
+
+    async for remaining in countdownTicks(5):
+        ...
+
+    Breaking out of the loop (or cancelling the task) stops the countdown.
+    See CountdownScheduler for the parameters.
+    '''
+    params = CountdownScheduler(seconds, outputUpdate, beepFreq, beepDuration, 
+                                incrDurationFlag, printOutFlag, audioOutFlag, start = False)
+    loop = asyncio.get_running_loop()
+    startTime = loop.time()
+    for delay, remaining, bd in params.ticks():
+        await asyncio.sleep(max(0, startTime + delay - loop.time()))
+        params._tick(remaining, bd)
+        yield remaining
+
+async def countdownAsync(seconds=10, outputUpdate=1, beepFreq=1000, beepDuration=0.5, 
+                         incrDurationFlag=True, printOutFlag=True, audioOutFlag=True, 
+                         onTick=None):
+    '''
+    Awaitable countdown, returns at the end of the countdown. 
+    Run it as a task to keep working meanwhile, cancel the task to stop it:
+
+    task = asyncio.create_task(countdownAsync(5))
+
+    onTick(remaining) is called at every tick. 
+    See CountdownScheduler for the other parameters.
+    '''
+    async for remaining in countdownTicks(seconds, outputUpdate, beepFreq, beepDuration, 
+                                          incrDurationFlag, printOutFlag, audioOutFlag):
+        if onTick is not None:
+            onTick(remaining)
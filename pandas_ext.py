@@ -4,7 +4,7 @@ note: extension of pandas operations
 """
 import numpy as np
 
-def cropDFInTime(df, startTime, endTime = np.nan, timeColumnName = 'time', resetZero = False, startFromZero = False, resetIndex = False):
+def cropDFInTime(df, startTime, endTime = np.nan, timeColumnName = 'time', resetZero = False, startFromZero = False, resetIndex = False, sortedTime = False, checkSorted = True):
     """
     Returns a copy of the dataframe where time is between startTime and endTime, 
     by default, keeps the original time.
@@ -14,6 +14,10 @@ def cropDFInTime(df, startTime, endTime = np.nan, timeColumnName = 'time', reset
     If startFromZero, the time column is decremented of the first element.
     As a result, the time column starts from 0.
     If resetIndex, the indexes start from 0, otherwise the original indexing is kept
+    If sortedTime, the time column is assumed sorted: the window is found 
+    with a binary search and a slice of df is returned without copying it 
+    (a copy is done only if resetZero or startFromZero). 
+    Modifying the returned slice may then modify df.
     
 
     Parameters
@@ -39,6 +43,14 @@ def cropDFInTime(df, startTime, endTime = np.nan, timeColumnName = 'time', reset
         if True, the indexes start from 0
         if False, the original indexing is kept
         The default is False.
+    sortedTime : bool
+        if True, the time column is assumed to be sorted in increasing order 
+        and the window is found with np.searchsorted, without copying df.
+        The default is False.
+    checkSorted : bool
+        if True and sortedTime, checks once that the time column is sorted, 
+        otherwise uses the usual (copying) method.
+        The default is True.
 
     Returns
     -------
@@ -46,12 +58,18 @@ def cropDFInTime(df, startTime, endTime = np.nan, timeColumnName = 'time', reset
         The one with time between startTime and endTime.
 
     """
-    df_cropped = df.copy()
+    if sortedTime and (not checkSorted or df[timeColumnName].is_monotonic_increasing):
+        df_cropped = _sliceSortedDFInTime(df, startTime, endTime, timeColumnName)
+        # a copy is needed only if the time column is modified
+        if resetZero or startFromZero:
+            df_cropped = df_cropped.copy()
+    else:
+        df_cropped = df.copy()
 
-    # consider only the part between startTime and endTime
-    if not np.isnan(endTime): # if endTime is defined
-        df_cropped = df_cropped[df_cropped[timeColumnName] <= endTime]
-    df_cropped = df_cropped[df_cropped[timeColumnName] >= startTime]
+        # consider only the part between startTime and endTime
+        if not np.isnan(endTime): # if endTime is defined
+            df_cropped = df_cropped[df_cropped[timeColumnName] <= endTime]
+        df_cropped = df_cropped[df_cropped[timeColumnName] >= startTime]
 
     # the initial moment is startTime
     if resetZero:
@@ -62,6 +80,103 @@ def cropDFInTime(df, startTime, endTime = np.nan, timeColumnName = 'time', reset
         df_cropped[timeColumnName] -= df_cropped[timeColumnName].iloc[0]
 
     if resetIndex:
-        df_cropped.reset_index(drop = True, inplace = True)
+        df_cropped = df_cropped.reset_index(drop = True)
+
+    return df_cropped
+
+def _sliceSortedDFInTime(df, startTime, endTime, timeColumnName):
+    # rows with startTime <= time <= endTime, time column sorted
+    times = df[timeColumnName].to_numpy()
+    start = np.searchsorted(times, startTime, side = 'left')
+    if np.isnan(endTime):
+        end = len(times)
+    else:
+        end = np.searchsorted(times, endTime, side = 'right')
+    return df.iloc[start:end]
+
+def cropDFInTimeWindows(df, startTimes, endTimes, timeColumnName = 'time', resetZero = False, startFromZero = False, resetIndex = False, longForm = False, windowColumnName = 'window'):
+    """
+    Crops df in many time windows at once, with the same meaning of 
+    cropDFInTime for each window [startTimes[i], endTimes[i]].
+    The time column is sorted only once (if it's not already sorted) and 
+    the boundaries of all the windows are found with a single np.searchsorted.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        The one to be cropped.
+    startTimes : list or np.array of float
+        starting time of each window.
+    endTimes : list or np.array of float
+        ending time of each window, np.nan means no cutting of the end.
+    timeColumnName : string, optional
+        name of the column containing the time. The default is 'time'.
+    resetZero : bool
+        if True, the time of each window starts from its startTime.
+        The default is False.
+    startFromZero : bool
+        if True, the time of each window starts from its first element.
+        The default is False.
+    resetIndex : bool
+        if True, the indexes start from 0 (in each window if not longForm)
+        The default is False.
+    longForm : bool
+        if True, returns a single dataframe with all the windows one after 
+        the other and a column windowColumnName with the index of the window.
+        if False, returns a list of dataframes, which are slices of df 
+        (not copies) unless resetZero or startFromZero.
+        The default is False.
+    windowColumnName : string, optional
+        name of the column with the index of the window if longForm. 
+        The default is 'window'.
 
-    return df_cropped
\ No newline at end of file
+    Returns
+    -------
+    list of pandas dataframe or pandas dataframe
+        one for each window or, if longForm, all of them together.
+
+    """
+    startTimes = np.asarray(startTimes, dtype = float)
+    endTimes = np.asarray(endTimes, dtype = float)
+    assert startTimes.shape == endTimes.shape, \
+        f"startTimes and endTimes should have the same length, got {len(startTimes)} and {len(endTimes)}"
+
+    if not df[timeColumnName].is_monotonic_increasing:
+        df = df.sort_values(timeColumnName, kind = 'stable')
+    times = df[timeColumnName].to_numpy()
+
+    # boundaries of all the windows: startTime <= time <= endTime
+    starts = np.searchsorted(times, startTimes, side = 'left')
+    ends = np.searchsorted(times, np.where(np.isnan(endTimes), np.inf, endTimes), side = 'right')
+    lengths = np.maximum(ends - starts, 0)
+
+    if not longForm:
+        windows = []
+        for start, end, startTime in zip(starts, ends, startTimes):
+            window = df.iloc[start:max(start, end)]
+            if resetZero or startFromZero:
+                window = window.copy()
+                if startFromZero and len(window):
+                    window[timeColumnName] -= window[timeColumnName].iloc[0]
+                elif resetZero:
+                    window[timeColumnName] -= startTime
+            if resetIndex:
+                window = window.reset_index(drop = True)
+            windows.append(window)
+        return windows
+
+    # positions of the rows of all the windows, one after the other
+    windowIds = np.repeat(np.arange(len(starts)), lengths)
+    firstPositions = np.repeat(starts, lengths)
+    positions = firstPositions + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    # take already returns a new frame (without the SettingWithCopy flag of iloc)
+    df_windows = df.take(positions)
+    if startFromZero:
+        df_windows[timeColumnName] = times[positions] - times[firstPositions]
+    elif resetZero:
+        df_windows[timeColumnName] = times[positions] - np.repeat(startTimes, lengths)
+    df_windows.insert(0, windowColumnName, windowIds)
+    if resetIndex:
+        df_windows = df_windows.reset_index(drop = True)
+    return df_windows
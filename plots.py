@@ -6,17 +6,48 @@ Created on Wed Nov 16 15:38:34 2022
 """
 
 #%% imports
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 from . import utils
 # import utils
 
+def gridShape(nOfPlots, nrows = 0, ncols = 0):
+    '''
+    Number of rows and of columns of a grid containing nOfPlots elements. 
+    If nrows and/or ncols are 0 (or too small), they are computed to obtain 
+    a grid as square as possible
+    '''
+    if nrows*ncols < nOfPlots and nrows != 0 and ncols != 0:
+        nrows = 0
+        ncols = 0
+    if nrows == 0 and ncols == 0:
+        nrows = int(np.ceil(np.sqrt(nOfPlots)))
+        ncols = int(np.ceil(nOfPlots/nrows))
+    elif nrows == 0 and ncols != 0:
+        nrows = int(np.ceil(nOfPlots/ncols))
+    elif nrows != 0 and ncols == 0:
+        ncols = int(np.ceil(nOfPlots/nrows))
+    else:
+        pass
+        # both ncols and nrows are specified
+    return nrows, ncols
+
 def createSubPlots(nOfPlots = 0, sharex = False, sharey = False,
                    nrows = 0, ncols = 0, mainTitle = '', listTitles = [''],
-                   listXlabels = [''], listYlabels = ['']):
+                   listXlabels = [''], listYlabels = [''], templates = None,
+                   figsize = None, layout = 'tight'):
     '''
     Creates a grid of subplots with nOfPlots or nrows and ncols specified
 
+    If templates is a dictionary, the figures created are stored in it and, 
+    when a figure with the same grid and sharing is requested again, it's 
+    reused (its artists are removed, see clearAxes) instead of creating 
+    a new one. Useful when many figures are created and saved one after 
+    the other. The figures stored in templates must be closed by the caller
+
     Parameters
     ----------
     nOfPlots : int, optional
@@ -42,6 +73,13 @@ def createSubPlots(nOfPlots = 0, sharex = False, sharey = False,
     listYlabels : list, optional
         list of y label of each axis, ordered in a horizontal list as the axes appear. 
         If no y label is associated with an axis, use '' as a placeholder, by default ['']
+    templates : dict, optional
+        dictionary of the figures to be reused, by default None
+    figsize : tuple, optional
+        size of the figure in inches, by default None (matplotlib default)
+    layout : str, optional
+        layout engine, see applyLayout. If 'constrained', the constrained 
+        layout engine is set on the figure, by default 'tight'
 
     Returns
     -------
@@ -51,20 +89,7 @@ def createSubPlots(nOfPlots = 0, sharex = False, sharey = False,
         DESCRIPTION.
     '''
 
-    # detect number of rows and of columns
-    if nrows*ncols < nOfPlots and nrows != 0 and ncols != 0:
-        nrows = 0
-        ncols = 0
-    if nrows == 0 and ncols == 0:
-        nrows = int(np.ceil(np.sqrt(nOfPlots)))
-        ncols = int(np.ceil(nOfPlots/nrows))
-    elif nrows == 0 and ncols != 0:
-        nrows = int(np.ceil(nOfPlots/ncols))
-    elif nrows != 0 and ncols == 0:
-        ncols = int(np.ceil(nOfPlots/nrows))
-    else:
-        pass
-        # both ncols and nrows are specified
+    nrows, ncols = gridShape(nOfPlots, nrows, ncols)
 
     # add empty titles in the end if some are missing
     listTitles = utils.make_list(listTitles)
@@ -74,8 +99,19 @@ def createSubPlots(nOfPlots = 0, sharex = False, sharey = False,
     listXlabels.extend(['']*(nOfPlots-len(listXlabels)))
     listYlabels.extend(['']*(nOfPlots-len(listYlabels)))
 
-    # create the figure with subplots
-    fig, ax = plt.subplots(nrows, ncols, sharex = sharex, sharey = sharey, squeeze = False)
+    # create the figure with subplots or reuse the template
+    figsize = None if figsize is None else tuple(figsize)
+    key = (nOfPlots, nrows, ncols, sharex, sharey, figsize, layout)
+    isNew = templates is None or key not in templates
+    if isNew:
+        fig, ax = plt.subplots(nrows, ncols, sharex = sharex, sharey = sharey, squeeze = False, 
+                               figsize = figsize, layout = 'constrained' if layout == 'constrained' else None)
+        if templates is not None:
+            templates[key] = (fig, ax)
+    else:
+        fig, ax = templates[key]
+        plt.figure(fig.number)
+        clearAxes(ax)
     plt.suptitle(mainTitle)
             
     ac = -1 #ax counter
@@ -88,13 +124,133 @@ def createSubPlots(nOfPlots = 0, sharex = False, sharey = False,
             this_ax.set_title(listTitles[ac])
             this_ax.set_xlabel(listXlabels[ac])
             this_ax.set_ylabel(listYlabels[ac])
-            this_ax.grid()
+            if isNew:
+                this_ax.grid()
     return fig, ax
+
+_LAYOUT_CACHE = {}
+
+def applyLayout(fig, ax, nOfPlots, sharex = False, sharey = False, layout = 'tight'):
+    '''
+    Adjusts the position of the axes of fig.
+    
+    layout can be:
+    - 'tight': tight_layout is computed (slow)
+    - 'cached': tight_layout is computed only the first time for a given 
+    (nOfPlots, nrows, ncols, figsize, sharex, sharey), the resulting subplot 
+    parameters are stored and applied directly to the following figures. 
+    The titles and labels of the following figures are supposed to have 
+    more or less the same size of the first one
+    - 'constrained': nothing is done here, the constrained layout engine 
+    (set by createSubPlots) adjusts the axes when the figure is drawn
+    - None: nothing is done
+    '''
+    if layout == 'tight':
+        fig.tight_layout()
+    elif layout == 'cached':
+        key = (nOfPlots, ax.shape[0], ax.shape[1], tuple(fig.get_size_inches()), sharex, sharey)
+        params = _LAYOUT_CACHE.get(key)
+        if params is None:
+            fig.tight_layout()
+            sp = fig.subplotpars
+            _LAYOUT_CACHE[key] = dict(left = sp.left, right = sp.right, bottom = sp.bottom, 
+                                      top = sp.top, wspace = sp.wspace, hspace = sp.hspace)
+        else:
+            fig.subplots_adjust(**params)
+    else:
+        assert layout in ['constrained', None], f"layout should be 'tight', 'cached', 'constrained' or None, got {layout}"
+
+def clearLayoutCache():
+    '''
+    Empties the cache of the subplot parameters used by applyLayout
+    '''
+    _LAYOUT_CACHE.clear()
+
+def clearAxes(ax):
+    '''
+    Removes lines, images, texts, collections, patches and legend from each 
+    axis in ax and restores autoscaling, the color cycle, the aspect, the 
+    direction of the axes and their visibility (changed by imshow and by 
+    the mosaic of pltsImg), so that the axes can be used for a new plot 
+    without creating a new figure
+    '''
+    for this_ax in np.ravel(ax):
+        for artist in (list(this_ax.lines) + list(this_ax.images) + list(this_ax.texts) 
+                       + list(this_ax.collections) + list(this_ax.patches)):
+            artist.remove()
+        if this_ax.get_legend() is not None:
+            this_ax.get_legend().remove()
+        cid = getattr(this_ax, '_redecimation_cid', None)
+        if cid is not None:
+            this_ax.callbacks.disconnect(cid)
+            this_ax._redecimation_cid = None
+        this_ax.relim()
+        this_ax.set_autoscale_on(True)
+        this_ax.set_prop_cycle(None)
+        this_ax.set_aspect('auto')
+        this_ax.set_axis_on()
+        if this_ax.xaxis_inverted():
+            this_ax.invert_xaxis()
+        if this_ax.yaxis_inverted():
+            this_ax.invert_yaxis()
        
+def decimateMinMax(x, y, nBuckets):
+    '''
+    Reduces the series (x, y) to at most about 2*nBuckets points: the samples 
+    are divided in nBuckets groups of consecutive samples and only the 
+    minimum and the maximum of each group are kept (in their original order), 
+    so the peaks are preserved, together with the first and the last sample.
+
+    Parameters
+    ----------
+    x : np.array
+        x values.
+    y : np.array
+        y values, same length of x.
+    nBuckets : int
+        number of groups (usually the width in pixels of the axis).
+
+    Returns
+    -------
+    tuple of 2 np.array
+        decimated x and y.
+    '''
+    n = len(y)
+    nBuckets = max(int(nBuckets), 1)
+    if n <= 2*nBuckets:
+        return x, y
+    size = int(np.ceil(n / nBuckets))
+    nFull = n // size
+    groups = y[:nFull*size].reshape(nFull, size)
+    offsets = np.arange(nFull)*size
+    # the first and the last samples are always kept, so the x range doesn't shrink
+    indexes = [np.array([0, n-1]), offsets + np.argmin(groups, axis = 1), 
+               offsets + np.argmax(groups, axis = 1)]
+    if nFull*size < n: # last incomplete group
+        rest = y[nFull*size:]
+        indexes.append(nFull*size + np.array([np.argmin(rest), np.argmax(rest)]))
+    indexes = np.unique(np.concatenate(indexes))
+    return x[indexes], y[indexes]
+
+def _connect_redecimation(this_ax, decimatedSeries, nBuckets):
+    # when the x limits change, the visible part of each series is decimated again
+    decimatedSeries = [(line, x, y) for line, x, y in decimatedSeries if np.all(np.diff(x) >= 0)]
+    if not decimatedSeries:
+        return
+    def on_xlim_changed(changed_ax):
+        xmin, xmax = changed_ax.get_xlim()
+        for line, x, y in decimatedSeries:
+            # one sample more on each side, so the line reaches the borders
+            start = max(np.searchsorted(x, xmin, side = 'left') - 1, 0)
+            end = np.searchsorted(x, xmax, side = 'right') + 1
+            line.set_data(*decimateMinMax(x[start:end], y[start:end], nBuckets))
+    this_ax._redecimation_cid = this_ax.callbacks.connect('xlim_changed', on_xlim_changed)
+
 def plts(X = [], Y = [], sharex = False, sharey = False, nrows = 0, ncols = 0, 
 mainTitle = '', listTitles = [''], listXlabels = [''], listYlabels = [''], 
 listLegLabels = [''], listXlim = [''], listYlim = [''], listOfkwargs = [{}], 
-common_kwargs = {'marker': '.'}):
+common_kwargs = {'marker': '.'}, decimate = False, templates = None, figsize = None, 
+layout = 'tight'):
     '''
     Given (X,Y), plots them
     X and Y can be 
@@ -133,6 +289,11 @@ common_kwargs = {'marker': '.'}):
 
     common_kwargs are applied to all the plots, the same parameter can be overwritten 
     by means of the corresponding value in listOfkwargs.  
+
+    decimate allows to plot very long series: each series with more samples 
+    than 2 times the width in pixels of its axis is reduced with 
+    decimateMinMax, and decimated again from the full data when zooming 
+    or panning, so the details remain visible.
     
     Parameters
     ----------
@@ -178,6 +339,15 @@ common_kwargs = {'marker': '.'}):
         by default [{}]
     common_kwargs : dict, optional
         kwarg applied to all the plots, by default {'marker': '.'}      
+    decimate : bool, optional
+        if True, the long series are decimated, by default False
+    templates : dict, optional
+        figures to be reused, see createSubPlots, by default None
+    figsize : tuple, optional
+        size of the figure in inches, by default None
+    layout : str, optional
+        'tight', 'cached', 'constrained' or None, see applyLayout, 
+        by default 'tight'
     
     Returns
     -------
@@ -187,23 +357,19 @@ common_kwargs = {'marker': '.'}):
         DESCRIPTION.
     '''
 
-    Y = utils.make_listOfList_or_listOfNpArray(Y)
+    Y, _ = utils.normalize_input(Y)
     nOfPlots = len(Y)
 
     if utils.is_emptyList_or_emptyNpArray(X):
-        
-        if utils.is_list_containing_lists_or_npArray(Y):
-            X = []
-            for y in Y:
-                x_tmp = []
-                if utils.is_list_containing_lists_or_npArray(y):
-                    for i in range(len(y)):
-                        x_tmp.append([])
-                X.append(x_tmp)
-        else:          
-            X = [[]] * nOfPlots
+        X = []
+        for y in Y:
+            x_tmp = []
+            if utils.is_list_containing_lists_or_npArray(y):
+                for i in range(len(y)):
+                    x_tmp.append([])
+            X.append(x_tmp)
     else:
-        X = utils.make_listOfList_or_listOfNpArray(X) 
+        X, _ = utils.normalize_input(X)
 
     listLegLabels = utils.make_list(listLegLabels)
     listOfkwargs = utils.make_list(listOfkwargs)
@@ -211,7 +377,7 @@ common_kwargs = {'marker': '.'}):
     listYlim = utils.make_list(listYlim)
 
     fig, ax = createSubPlots(nOfPlots, sharex, sharey, nrows, ncols, mainTitle, 
-    listTitles, listXlabels, listYlabels)
+    listTitles, listXlabels, listYlabels, templates, figsize, layout)
 
     nrows = len(ax)
     ncols = len(ax[0])
@@ -225,8 +391,8 @@ common_kwargs = {'marker': '.'}):
                 continue
 
             this_ax = ax[row, col]
-            this_X = utils.make_listOfList_or_listOfNpArray(X[ac])
-            this_Y = utils.make_listOfList_or_listOfNpArray(Y[ac])
+            this_X, _ = utils.normalize_input(X[ac])
+            this_Y, _ = utils.normalize_input(Y[ac])
             
             # setting x lim for this axis
             try:
@@ -241,12 +407,23 @@ common_kwargs = {'marker': '.'}):
             except: 
                 pass
 
+            if decimate:
+                nBuckets = int(this_ax.get_window_extent().width)
+                decimatedSeries = []
+
             tac = -1 #this ax counter
             for x, y in zip (this_X, this_Y):
                 lkc += 1
                 tac += 1
 
                 this_plt_kwargs = common_kwargs.copy()
+                x_is_empty = utils.is_emptyList_or_emptyNpArray(x)
+                x_full = None
+                if decimate and utils.get_length(y) > 2*nBuckets:
+                    y_full = np.asarray(y, dtype = float)
+                    x_full = np.arange(len(y_full)) if x_is_empty else np.asarray(x, dtype = float)
+                    x, y = decimateMinMax(x_full, y_full, nBuckets)
+                    x_is_empty = False
                 try:
                     this_plt_kwargs.update(listOfkwargs[lkc])
                 except:
@@ -257,23 +434,99 @@ common_kwargs = {'marker': '.'}):
                         this_plt_label = listLegLabels[lkc]
                         if this_plt_label == '':
                             raise Exception()
-                        if not utils.is_emptyList_or_emptyNpArray(x):
+                        if not x_is_empty:
                             this_ax.plot(x, y, **this_plt_kwargs, label = this_plt_label)
                         else:
                             this_ax.plot(y, **this_plt_kwargs, label = this_plt_label)
                         this_ax.legend()
                     except:
                         # if no label for this plot
-                        if not utils.is_emptyList_or_emptyNpArray(x):
+                        if not x_is_empty:
                             this_ax.plot(x, y, **this_plt_kwargs)
                         else:
                             this_ax.plot(y, **this_plt_kwargs)
+                if x_full is not None:
+                    decimatedSeries.append((this_ax.lines[-1], x_full, y_full))
+
+            if decimate and decimatedSeries:
+                _connect_redecimation(this_ax, decimatedSeries, nBuckets)
             
-    plt.tight_layout()
+    applyLayout(fig, ax, nOfPlots, sharex, sharey, layout)
     return fig, ax
      
+def _tile_to_uint8(img, cmap):
+    # same representation imshow would give to the image alone
+    if img.ndim == 2:
+        img = img.astype(float)
+        vmin, vmax = np.nanmin(img), np.nanmax(img)
+        norm = (img - vmin) / (vmax - vmin) if vmax > vmin else np.zeros_like(img)
+        return plt.get_cmap(cmap)(norm, bytes = True)[..., :3]
+    if np.issubdtype(img.dtype, np.floating):
+        return (np.clip(img, 0, 1)*255).round().astype(np.uint8)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def mosaicImages(imgs, nrows = 0, ncols = 0, maxTileSize = None, pad = 2, padValue = 0, 
+                  cmap = None):
+    '''
+    Packs all the images in a single uint8 canvas, as a grid of tiles.
+    Each tile looks like the image shown alone by imshow: gray images are 
+    scaled with their own min and max and colored with cmap, RGB(A) images 
+    are considered in [0, 1] if float and in [0, 255] if integer. 
+    RGB tiles get an opaque alpha channel if there is at least one RGBA image.
+
+    Parameters
+    ----------
+    imgs : list
+        list of images (lists or np.arrays, gray, RGB or RGBA).
+    nrows : int, optional
+        number of rows of tiles, by default 0
+    ncols : int, optional
+        number of cols of tiles, by default 0
+    maxTileSize : int, optional
+        if specified, images bigger than maxTileSize pixels on one side are 
+        downscaled (taking one pixel every n) , by default None
+    pad : int, optional
+        pixels between the tiles, by default 2
+    padValue : int, optional
+        value (0-255) of the background of the canvas, by default 0
+    cmap : str, optional
+        colormap of the gray images, by default None (matplotlib default)
+
+    Returns
+    -------
+    canvas : np.array
+        image containing all the tiles.
+    origins : list
+        (row, col) of the top left pixel of each tile in the canvas.
+    '''
+    imgs = [np.asarray(img) for img in imgs]
+    if maxTileSize:
+        imgs = [img[::step, ::step] for img, step in
+                zip(imgs, [int(np.ceil(max(img.shape[:2]) / maxTileSize)) for img in imgs])]
+    imgs = [_tile_to_uint8(img, cmap) for img in imgs]
+    nrows, ncols = gridShape(len(imgs), nrows, ncols)
+    channels = max([img.shape[2] for img in imgs])
+    tileH = max([img.shape[0] for img in imgs])
+    tileW = max([img.shape[1] for img in imgs])
+
+    shape = (nrows*tileH + (nrows-1)*pad, ncols*tileW + (ncols-1)*pad, channels)
+    canvas = np.full(shape, padValue, dtype = np.uint8)
+
+    origins = []
+    for i, img in enumerate(imgs):
+        r0 = (i // ncols) * (tileH + pad)
+        c0 = (i % ncols) * (tileW + pad)
+        h, w = img.shape[:2]
+        tile = canvas[r0:r0+h, c0:c0+w]
+        tile[..., :img.shape[2]] = img
+        if channels == 4 and img.shape[2] == 3:
+            tile[..., 3] = 255
+        origins.append((r0, c0))
+    return canvas, origins
+
 def pltsImg(imgs, sharex = False, sharey = False, nrows = 0, ncols = 0, 
-mainTitle = '', listTitles = [''], listXlabels = [''], listYlabels = ['']):
+mainTitle = '', listTitles = [''], listXlabels = [''], listYlabels = [''],
+mosaic = False, maxTileSize = None, templates = None, figsize = None, layout = 'tight'):
     '''
     Given (X,Y), plots them
     X and Y can be 
@@ -312,6 +565,11 @@ mainTitle = '', listTitles = [''], listXlabels = [''], listYlabels = ['']):
 
     common_kwargs are applied to all the plots, the same parameter can be 
     overwritten by means of the corresponding value in listOfkwargs.  
+
+    mosaic allows to show many images much faster: all the images are packed 
+    in a single canvas (see mosaicImages) shown with only one imshow and the 
+    titles are written over the tiles. In this case sharex, sharey, 
+    listXlabels and listYlabels are ignored.
     
     Parameters
     ----------
@@ -349,6 +607,17 @@ mainTitle = '', listTitles = [''], listXlabels = [''], listYlabels = ['']):
         by default [{}]
     common_kwargs : dict, optional
         kwarg applied to all the plots, by default {'marker': '.'}      
+    mosaic : bool, optional
+        if True, all the images are shown in a single axis, by default False
+    maxTileSize : int, optional
+        only if mosaic, maximum size in pixels of each tile, by default None
+    templates : dict, optional
+        figures to be reused, see createSubPlots, by default None
+    figsize : tuple, optional
+        size of the figure in inches, by default None
+    layout : str, optional
+        'tight', 'cached', 'constrained' or None, see applyLayout, 
+        by default 'tight'
     
     Returns
     -------
@@ -361,7 +630,23 @@ mainTitle = '', listTitles = [''], listXlabels = [''], listYlabels = ['']):
     imgs = utils.make_listOfList_or_listOfNpArray(imgs)
     nOfPlots = len(imgs)
 
-    fig, ax = createSubPlots(nOfPlots, sharex, sharey, nrows, ncols, mainTitle, listTitles, listXlabels, listYlabels)
+    if mosaic:
+        canvas, origins = mosaicImages(imgs, nrows, ncols, maxTileSize)
+        fig, ax = createSubPlots(1, mainTitle = mainTitle, templates = templates, 
+                                 figsize = figsize, layout = layout)
+        this_ax = ax[0, 0]
+        this_ax.imshow(canvas, interpolation = None)
+        this_ax.set_axis_off()
+        listTitles = utils.make_list(listTitles)
+        for title, (r0, c0) in zip(listTitles, origins):
+            if title != '':
+                this_ax.text(c0, r0, title, fontsize = 'small', va = 'top', ha = 'left',
+                             bbox = dict(facecolor = 'white', alpha = 0.7, linewidth = 0))
+        applyLayout(fig, ax, 1, layout = layout)
+        return fig, ax
+
+    fig, ax = createSubPlots(nOfPlots, sharex, sharey, nrows, ncols, mainTitle, 
+    listTitles, listXlabels, listYlabels, templates, figsize, layout)
 
     nrows = len(ax)
     ncols = len(ax[0])
@@ -375,36 +660,316 @@ mainTitle = '', listTitles = [''], listXlabels = [''], listYlabels = ['']):
 
             this_ax = ax[row, col]
             this_ax.imshow(imgs[ac], interpolation = None)
-    plt.tight_layout()
+    applyLayout(fig, ax, nOfPlots, sharex, sharey, layout)
     return fig, ax
 
-def pltsImgColorPalette(num = 9):
+def colorPalette(num = 9):
+    '''
+    Palette of num levels (from 0 to 255) for each one of the 3 channels, 
+    built in one shot with broadcasting.
+
+    Parameters
+    ----------
+    num : int, optional
+        number of levels of each channel, by default 9
+
+    Returns
+    -------
+    palette : np.array
+        num*num*num*3 uint8 array, palette[i, j, k] = [level i, level j, level k]. 
+        palette[i] is the image with the level i of channel 0, rows are the 
+        levels of channel 1 and columns the levels of channel 2.
+    '''
+    levels = (np.arange(num)/(num-1)*255).astype(np.uint8)
+    palette = np.empty((num, num, num, 3), dtype = np.uint8)
+    palette[..., 0] = levels[:, np.newaxis, np.newaxis]
+    palette[..., 1] = levels[np.newaxis, :, np.newaxis]
+    palette[..., 2] = levels[np.newaxis, np.newaxis, :]
+    return palette
+
+def colorPaletteImage(num = 9, cellSize = 1, nrows = 0, ncols = 0, padValue = 255):
+    '''
+    Single image (LUT) containing all the colors of colorPalette, one tile 
+    for each level of channel 0. 
+    It can be saved (ex: cv2.imwrite) and given to imagelib.filterImage3Channels 
+    to see which colors are kept by some thresholds (mind that the channels 
+    are in the order 0, 1, 2: cv2 considers them as B, G, R).
+
+    Parameters
+    ----------
+    num : int, optional
+        number of levels of each channel, by default 9
+    cellSize : int, optional
+        size in pixels of the square of each color, by default 1
+    nrows : int, optional
+        number of rows of tiles, by default 0
+    ncols : int, optional
+        number of cols of tiles, by default 0
+    padValue : int, optional
+        value of the pixels between the tiles, by default 255
+
+    Returns
+    -------
+    canvas : np.array
+        the LUT image.
+    origins : list
+        (row, col) of the top left pixel of the tile of each level of channel 0.
+    '''
+    palette = colorPalette(num)
+    if cellSize > 1:
+        palette = np.repeat(np.repeat(palette, cellSize, axis = 1), cellSize, axis = 2)
+    return mosaicImages(list(palette), nrows, ncols, pad = cellSize, padValue = padValue)
+
+def pltsImgColorPalette(num = 9, mosaic = True):
     '''
     shows a grid of plot giving the values of the different RGB formats
 
-    _extended_summary_
+    Each image has a fixed value of R, the rows are the values of G and 
+    the columns the values of B.
 
     Parameters
     ----------
     num : int, optional
-        _description_, by default 9
+        number of levels of each channel, by default 9
+    mosaic : bool, optional
+        if True, the images are shown in a single axis, otherwise in one 
+        axis each (with labels), by default True
+
+    Returns
+    -------
+    fig : matplotlib figure
+        DESCRIPTION.
+    ax : 2d array of axes
+        DESCRIPTION.
     '''
-    imgs = []
-    for r in np.linspace(0,num-1,num):
-        r = int(r)
-        img = np.ones((num,num,3))
-        img[:,:,0] = r/(num-1)*255
-        for g in np.linspace(0,num-1,num):
-            g = int(g)             
-            img[g,:,1] = g/(num-1)*255
-            for b in np.linspace(0,num-1,num):
-                b = int(b)          
-                img[g,b,2] = b/(num-1)*255
-        imgs.append(img.astype(np.uint8))
-
-    pltsImg(imgs, mainTitle = 'RGB Palette', 
+    return pltsImg(list(colorPalette(num)), mainTitle = 'RGB Palette', 
     listTitles = ['R:{}'.format(i/(num-1)*255) for i in range(num)], 
-    listYlabels = ['G (0->255)']*(num), listXlabels= ['B (0->255)']*(num))
+    listYlabels = ['G (0->255)']*(num), listXlabels= ['B (0->255)']*(num), mosaic = mosaic)
+
+def _init_export_worker():
+    # the figures are only saved, never shown
+    import matplotlib
+    matplotlib.use('Agg')
+
+def _export_chunk(items, figsize, dpi):
+    # renders and saves a group of items reusing the same figures, then closes them
+    plotFunctions = {'plts': plts, 'pltsImg': pltsImg}
+    templates = {name: {} for name in plotFunctions}
+    report = []
+    try:
+        for item in items:
+            item = item.copy()
+            item.setdefault('figsize', figsize)
+            path = item.pop('path')
+            function = item.pop('function', 'plts')
+            start = time.perf_counter()
+            try:
+                fig, ax = plotFunctions[function](**item, templates = templates[function])
+                fig.savefig(path, dpi = dpi)
+                error = None
+            except Exception as e:
+                error = e
+            report.append((path, time.perf_counter() - start, error))
+    finally:
+        for figures in templates.values():
+            for fig, ax in figures.values():
+                plt.close(fig)
+    return report
+
+def exportFigures(items, nWorkers = None, chunkSize = 16, figsize = None, dpi = 100):
+    '''
+    Renders and saves many figures off-screen (Agg backend) in a pool of 
+    processes. Inside each group of chunkSize items the figures with the same 
+    layout are reused (see createSubPlots), then they are closed.
+
+    Each item is a dictionary with:
+    - 'path': complete path of the file to be saved (the extension defines the format)
+    - 'function': 'plts' or 'pltsImg', by default 'plts'
+    - all the other keys are passed to the function as kwargs (for example 
+    layout = 'cached' to avoid computing tight_layout for each figure)
+
+    Parameters
+    ----------
+    items : list
+        list of dictionaries.
+    nWorkers : int, optional
+        number of processes, if 0 everything is done in this process (with 
+        the current backend), by default None (number of cpu)
+    chunkSize : int, optional
+        number of items rendered by a process at each time, by default 16
+    figsize : tuple, optional
+        size in inches of the saved figures if not specified in the item, 
+        by default None (matplotlib default)
+    dpi : int, optional
+        resolution of the saved figures, by default 100
+
+    Returns
+    -------
+    list
+        one (path, render time [s], error) for each item, in the same order 
+        of items. error is None if the figure was saved, otherwise it's the 
+        exception raised.
+    '''
+    chunks = [items[i:i+chunkSize] for i in range(0, len(items), chunkSize)]
+    if nWorkers == 0:
+        reports = [_export_chunk(chunk, figsize, dpi) for chunk in chunks]
+    else:
+        nWorkers = nWorkers if nWorkers else os.cpu_count()
+        with ProcessPoolExecutor(max_workers = nWorkers, initializer = _init_export_worker) as executor:
+            reports = list(executor.map(_export_chunk, chunks, [figsize]*len(chunks), [dpi]*len(chunks)))
+    return [r for report in reports for r in report]
+
+class LivePlot:
+    '''
+    Subplots (see createSubPlots) for monitoring streaming data.
+
+    The lines are created once and then only their data is updated, 
+    the last bufferSize samples of each series are kept in a ring buffer. 
+    The redraw uses blitting: the static part of the figure (axes, grid, 
+    labels) is drawn once and saved, then only the lines are redrawn on top 
+    of it. A full redraw happens only when the limits of an axis change.
+
+    live = LivePlot(nOfPlots = 2, seriesPerPlot = [2, 1], bufferSize = 500)
+    while acquiring:
+        live.append(0, 0, t, y0)
+        live.append(0, 1, t, y1)
+        live.append(1, 0, t, y2)
+        live.refresh()
+
+    Parameters
+    ----------
+    nOfPlots : int, optional
+        number of axes, by default 1
+    seriesPerPlot : int or list, optional
+        number of lines in each axis (same for all if int), by default 1
+    bufferSize : int, optional
+        number of samples shown for each series, by default 1000
+    ylims : list, optional
+        fixed [ymin, ymax] of each axis (None to follow the data). 
+        Fixed limits avoid full redraws, by default None
+    listLegLabels : list, optional
+        label of each series, ordered in a horizontal list as the series appear, 
+        by default ['']
+    common_kwargs : dict, optional
+        kwargs applied to all the lines, by default {}
+    show : bool, optional
+        show the figure without blocking, by default True
+    other parameters: see createSubPlots
+    '''
+
+    def __init__(self, nOfPlots = 1, seriesPerPlot = 1, bufferSize = 1000, sharex = False, 
+                 sharey = False, nrows = 0, ncols = 0, mainTitle = '', listTitles = [''], 
+                 listXlabels = [''], listYlabels = [''], ylims = None, listLegLabels = [''], 
+                 common_kwargs = {}, show = True):
+        self.fig, self.ax = createSubPlots(nOfPlots, sharex, sharey, nrows, ncols, mainTitle, 
+                                           listTitles, listXlabels, listYlabels)
+        self.axes = list(self.ax.flatten()[:nOfPlots])
+        self.canvas = self.fig.canvas
+        self.bufferSize = int(bufferSize)
+        if np.isscalar(seriesPerPlot):
+            seriesPerPlot = [seriesPerPlot]*nOfPlots
+        self.ylims = utils.make_list(ylims) if ylims is not None else [None]*nOfPlots
+        self.ylims.extend([None]*(nOfPlots-len(self.ylims)))
+        listLegLabels = utils.make_list(listLegLabels)
+
+        # ring buffers and lines: one for each series of each axis
+        self._x = []
+        self._y = []
+        self._n = []
+        self.lines = []
+        lc = -1 # listLegLabels counter
+        for this_ax, nSeries, ylim in zip(self.axes, seriesPerPlot, self.ylims):
+            self._x.append(np.zeros((nSeries, self.bufferSize)))
+            self._y.append(np.zeros((nSeries, self.bufferSize)))
+            self._n.append([0]*nSeries)
+            axLines = []
+            for s in range(nSeries):
+                lc += 1
+                label = listLegLabels[lc] if lc < len(listLegLabels) else ''
+                line, = this_ax.plot([], [], animated = True, label = label or None, 
+                                     **common_kwargs)
+                axLines.append(line)
+            self.lines.append(axLines)
+            if ylim is not None:
+                this_ax.set_ylim(ylim)
+            if any(line.get_label() and not line.get_label().startswith('_') for line in axLines):
+                this_ax.legend(handles = axLines, loc = 'upper left')
+
+        self._backgrounds = None
+        self._needsFullDraw = True
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        if show:
+            plt.show(block = False)
+
+    def append(self, plotIndex, seriesIndex, x, y):
+        '''Adds the sample(s) x, y (scalars or arrays) to the series seriesIndex of plot plotIndex'''
+        x = np.atleast_1d(x)
+        y = np.atleast_1d(y)
+        if len(x) > self.bufferSize:
+            x = x[-self.bufferSize:]
+            y = y[-self.bufferSize:]
+        n = self._n[plotIndex][seriesIndex]
+        pos = (n + np.arange(len(x))) % self.bufferSize
+        self._x[plotIndex][seriesIndex, pos] = x
+        self._y[plotIndex][seriesIndex, pos] = y
+        self._n[plotIndex][seriesIndex] = n + len(x)
+
+    def get_data(self, plotIndex, seriesIndex):
+        '''x and y of a series in chronological order'''
+        n = self._n[plotIndex][seriesIndex]
+        x = self._x[plotIndex][seriesIndex]
+        y = self._y[plotIndex][seriesIndex]
+        if n <= self.bufferSize:
+            return x[:n], y[:n]
+        start = n % self.bufferSize
+        return np.concatenate((x[start:], x[:start])), np.concatenate((y[start:], y[:start]))
+
+    def refresh(self):
+        '''Updates the lines with the buffered data and redraws them'''
+        for axIndex, (this_ax, axLines) in enumerate(zip(self.axes, self.lines)):
+            xmin, xmax, ymin, ymax = np.inf, -np.inf, np.inf, -np.inf
+            for seriesIndex, line in enumerate(axLines):
+                x, y = self.get_data(axIndex, seriesIndex)
+                line.set_data(x, y)
+                if len(x):
+                    xmin, xmax = min(xmin, x[0], x.min()), max(xmax, x[-1], x.max())
+                    ymin, ymax = min(ymin, np.nanmin(y)), max(ymax, np.nanmax(y))
+            if xmin <= xmax:
+                self._update_limits(this_ax, xmin, xmax, ymin, ymax, self.ylims[axIndex])
+
+        if self._needsFullDraw or self._backgrounds is None:
+            # draws the static part and saves it (see _on_draw)
+            self._needsFullDraw = False
+            self.canvas.draw()
+        else:
+            for this_ax, background in zip(self.axes, self._backgrounds):
+                self.canvas.restore_region(background)
+        self._draw_lines()
+        self.canvas.flush_events()
+
+    def _update_limits(self, this_ax, xmin, xmax, ymin, ymax, ylim):
+        # x follows the data, y expands if not fixed: both need a full redraw
+        curXmin, curXmax = this_ax.get_xlim()
+        if xmax > curXmax or xmin < curXmin:
+            span = max(xmax - xmin, 1e-9)
+            this_ax.set_xlim(xmin, xmax + 0.1*span)
+            self._needsFullDraw = True
+        if ylim is None and np.isfinite(ymin) and np.isfinite(ymax):
+            curYmin, curYmax = this_ax.get_ylim()
+            if ymax > curYmax or ymin < curYmin:
+                margin = 0.1*max(ymax - ymin, 1e-9)
+                this_ax.set_ylim(min(ymin - margin, curYmin), max(ymax + margin, curYmax))
+                self._needsFullDraw = True
+
+    def _draw_lines(self):
+        for this_ax, axLines in zip(self.axes, self.lines):
+            for line in axLines:
+                this_ax.draw_artist(line)
+            self.canvas.blit(this_ax.bbox)
+
+    def _on_draw(self, event):
+        # after every full draw (also resizing the window) the backgrounds are saved again
+        self._backgrounds = [self.canvas.copy_from_bbox(this_ax.bbox) for this_ax in self.axes]
 
 #%% just to figure out how does it work
 if __name__ == '__main__':
@@ -476,6 +1041,10 @@ if __name__ == '__main__':
 
     pltsImgColorPalette(4)
 
+    pltsImg([np.random.randint(0, 255, (200, 300, 3), dtype = np.uint8) for i in range(40)], 
+    listTitles = ['crop {}'.format(i) for i in range(40)], mainTitle = 'mosaic of 40 images', 
+    mosaic = True, maxTileSize = 100)
+
     
     plt.draw()
     plt.pause(0.001)
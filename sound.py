@@ -4,11 +4,33 @@ import vlc
 from gtts import gTTS
 import os
 import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 
 MAX_FREQ = 32767
 MIN_FREQ = 32
 SLEEP_TIME = 0.01
 
+# one worker thread for the beeps and one for the media (files and messages), 
+# created when needed, so a long media doesn't delay the beeps
+SOUND_WORKERS = ['beep', 'media']
+_soundExecutors = {}
+_soundExecutorLock = threading.Lock()
+
+def getSoundExecutor(worker = 'beep'):
+    '''
+    Returns the executor (with a single worker thread) used to play the 
+    queued sounds of worker ('beep' or 'media') one after the other, without 
+    creating a thread for each one. Sounds on the same worker are serialised, 
+    sounds on different workers can overlap.
+    '''
+    assert worker in SOUND_WORKERS, f"worker should be in {SOUND_WORKERS}, got {worker}"
+    with _soundExecutorLock:
+        if worker not in _soundExecutors:
+            _soundExecutors[worker] = ThreadPoolExecutor(max_workers = 1, 
+                                                        thread_name_prefix = 'sound-' + worker)
+    return _soundExecutors[worker]
+
 def __playBeep(freq = 1000, duration = 0.5):
     '''
     DEPRECTED, USE playBeep() instead that allows to decide if continue code execution while playing sound
@@ -39,6 +61,20 @@ def playBeep(freq = 1000, duration = 0.5, blockExec = False):
     else: # create a thread and execute the function
         thread = threading.Thread(target=__playBeep, args = (freq,duration,))
         thread.start()
+
+def playBeepQueued(freq = 1000, duration = 0.5):
+    '''
+    Plays a beep on the beep worker (see getSoundExecutor) without 
+    blocking the execution. Beeps queued while another beep is playing 
+    are played after it, files and messages don't delay them.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        done when the beep has been played.
+
+    '''
+    return getSoundExecutor('beep').submit(__playBeep, freq, duration)
     
 
 def __playFreq(startFreq = 5000, endFreq = 0, stepFreq = -500, duration = 0.5):
@@ -182,14 +218,41 @@ def playFile(source, duration = -1, blockExec = False):
         thread.start()
         time.sleep(SLEEP_TIME)
         
-def speakMessage(msg = 'this is a default msg', blockExec = False):
+def __saveMessage(msg):
+    # generates the audio of msg and returns the path of the temporary file
     audio = gTTS(msg)
     tmp_audio_file_name = os.path.join(os.getcwd(),'_ tmp msg generated by speakMessage function.mp3')
     audio.save(tmp_audio_file_name)
+    return tmp_audio_file_name
+
+def speakMessage(msg = 'this is a default msg', blockExec = False):
     # play audio with test code
-    playFile(tmp_audio_file_name, blockExec)
+    playFile(__saveMessage(msg), blockExec)
         
 
+#%% asyncio facade: beeps and tones on the beep worker, files and messages on the media one
+async def _runOnSoundExecutor(worker, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(getSoundExecutor(worker), func, *args)
+
+async def playBeepAsync(freq = 1000, duration = 0.5):
+    '''Awaitable version of playBeep, returns when the beep has been played'''
+    await _runOnSoundExecutor('beep', __playBeep, freq, duration)
+
+async def playFreqAsync(startFreq = 5000, endFreq = 0, stepFreq = -500, duration = 0.5):
+    '''Awaitable version of playFreq, returns when all the frequencies have been played'''
+    await _runOnSoundExecutor('beep', __playFreq, startFreq, endFreq, stepFreq, duration)
+
+async def playFileAsync(source, duration = -1):
+    '''Awaitable version of playFile, returns when the media has been played'''
+    await _runOnSoundExecutor('media', __playFile, source, duration)
+
+async def speakMessageAsync(msg = 'this is a default msg'):
+    '''Awaitable version of speakMessage, returns when the message has been played'''
+    def generateAndPlay():
+        __playFile(__saveMessage(msg))
+    await _runOnSoundExecutor('media', generateAndPlay)
+
 if __name__ == '__main__':
 
     filePath = r'C:\Users\eferlius\Downloads\tiStaShort.mp3'
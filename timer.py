@@ -4,10 +4,134 @@ Timer class
 """
 
 import time
+import math
+import functools
+import threading
+import json
+import os
+import csv
+from array import array
 
 class TimerError(Exception):
     """A custom exception used to report errors in use of Timer class"""
 
+class TraceRecorder:
+    """
+    Ring buffer of timestamped events, for instrumenting hot loops without 
+    printing or formatting anything while measuring.
+
+    Each event is stored as perf_counter_ns timestamp, section id and event 
+    type in preallocated arrays, so recording doesn't allocate memory. 
+    When the buffer is full, the oldest events are overwritten.
+
+    Parameters
+    ----------
+    capacity : int
+        maximum number of events kept, default is 65536
+
+    Methods
+    -------
+    section_id
+        id of a section name, to be obtained once outside the hot loop
+
+    begin, end, mark
+        record the start, the end or an instant of a section
+
+    drain
+        returns the recorded events and empties the buffer
+
+    export_chrome_trace
+        writes the events in the trace-event json format, which can be opened 
+        in chrome://tracing or https://ui.perfetto.dev
+    """
+    BEGIN = 0
+    END = 1
+    INSTANT = 2
+    _PHASES = ('B', 'E', 'i')
+
+    def __init__(self, capacity = 65536):
+        self.capacity = int(capacity)
+        self._timestamps = array('q', bytes(8 * self.capacity))
+        self._ids = array('i', bytes(4 * self.capacity))
+        self._types = array('b', bytes(self.capacity))
+        self._n = 0
+        self._names = []
+        self._nameIds = {}
+
+    def __len__(self):
+        return min(self._n, self.capacity)
+
+    @property
+    def dropped(self):
+        """Number of events overwritten since the last drain"""
+        return max(0, self._n - self.capacity)
+
+    def section_id(self, name):
+        """Id associated with name (created the first time)"""
+        sectionId = self._nameIds.get(name)
+        if sectionId is None:
+            sectionId = self._nameIds[name] = len(self._names)
+            self._names.append(name)
+        return sectionId
+
+    def record(self, sectionId, eventType):
+        """Record an event of eventType (BEGIN, END, INSTANT) of sectionId now"""
+        i = self._n % self.capacity
+        self._timestamps[i] = time.perf_counter_ns()
+        self._ids[i] = sectionId
+        self._types[i] = eventType
+        self._n += 1
+
+    def begin(self, sectionId):
+        self.record(sectionId, self.BEGIN)
+
+    def end(self, sectionId):
+        self.record(sectionId, self.END)
+
+    def mark(self, sectionId):
+        self.record(sectionId, self.INSTANT)
+
+    def drain(self):
+        """Returns the events as a list of (timestamp_ns, name, type) from 
+        the oldest to the newest and empties the buffer"""
+        n = len(self)
+        first = self._n - n
+        events = []
+        for k in range(first, self._n):
+            i = k % self.capacity
+            events.append((self._timestamps[i], self._names[self._ids[i]], self._types[i]))
+        self._n = 0
+        return events
+
+    def format(self, events = None):
+        """Human readable lines of the events (drains the buffer if events is None)"""
+        if events is None:
+            events = self.drain()
+        if not events:
+            return ''
+        t0 = events[0][0]
+        return '\n'.join('{:12.6f} ms {} {}'.format((ts-t0)/1e6, self._PHASES[ty], name) 
+                         for ts, name, ty in events)
+
+    def export_chrome_trace(self, file, events = None, pid = None, tid = 0):
+        """Writes the events (drains the buffer if events is None) in file in 
+        the chrome trace-event json format"""
+        if events is None:
+            events = self.drain()
+        pid = os.getpid() if pid is None else pid
+        traceEvents = []
+        for ts, name, ty in events:
+            event = {'name': name, 'ph': self._PHASES[ty], 'ts': ts/1000, 
+                     'pid': pid, 'tid': tid}
+            if ty == self.INSTANT:
+                event['s'] = 't'
+            traceEvents.append(event)
+        folder = os.path.split(file)[0]
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+        with open(file, 'w') as f:
+            json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, f)
+
 class Timer:
     """
     Simple timer for timing code(blocks).
@@ -20,6 +144,10 @@ class Timer:
         custom text, optional
     start : bool
         automatically start the timer when it's initialized, default is True
+    recorder : TraceRecorder
+        if given, lap, elap and stop don't print anything and only record 
+        an event in the recorder (named as lap_name, elap_name or 'stop'), 
+        which can be drained and formatted later. Default is None
 
     Methods
     -------
@@ -38,7 +166,9 @@ class Timer:
     """
 
     def __init__(self, name="", text="{:0.4f} seconds", string_lap = 'lap  : ', 
-                 string_elap = 'elap : ', string_stop = 'stop : ', start = True):
+                 string_elap = 'elap : ', string_stop = 'stop : ', start = True, 
+                 recorder = None):
+        self._recorder = recorder
         self._start_time = None
         self._lap_time = 0.
         self._name = name
@@ -76,7 +206,9 @@ class Timer:
         else:
             self._lap_time = time.perf_counter() - self._start_time
             current_lap = self._lap_time
-        if printTime:
+        if self._recorder is not None:
+            self._recorder.mark(self._recorder.section_id(lap_name or 'lap'))
+        elif printTime:
             if lap_name:
                 print(self._string_lap + self._text.format(current_lap) + ' [' + lap_name + ']')
             else:
@@ -88,7 +220,9 @@ class Timer:
         if self._start_time is None:
             raise TimerError("Timer is not running. Use .start() to start it")
         elapsed_time = time.perf_counter() - self._start_time
-        if printTime:
+        if self._recorder is not None:
+            self._recorder.mark(self._recorder.section_id(elap_name or 'elap'))
+        elif printTime:
             if elap_name:
                 print(self._string_elap + self._text.format(elapsed_time) + ' [' + elap_name + ']')
             else:
@@ -102,13 +236,406 @@ class Timer:
         elapsed_time = time.perf_counter() - self._start_time
         self._start_time = None
         self._lap_time = 0.
-        if printTime:
+        if self._recorder is not None:
+            self._recorder.mark(self._recorder.section_id('stop'))
+        elif printTime:
             print(self._string_stop + self._text.format(elapsed_time))
         
         return elapsed_time
     
 
 
+class SectionStats:
+    """
+    Streaming statistics of the durations of a section: count, sum, min, max 
+    and percentiles from a histogram with logarithmic bins (each bin is 
+    BIN_RATIO times wider than the previous one, so percentiles have a 
+    relative error lower than BIN_RATIO-1)
+
+    Methods
+    -------
+    add
+        add a duration [s]
+
+    percentile
+        approximate percentile of the durations
+
+    merge
+        add the statistics of another SectionStats
+    """
+    BINS_PER_OCTAVE = 16
+    BIN_RATIO = 2 ** (1 / BINS_PER_OCTAVE)
+    _LOG_SCALE = BINS_PER_OCTAVE / math.log(2)
+
+    __slots__ = ('count', 'total', 'min', 'max', 'bins')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.min = math.inf
+        self.max = 0.
+        self.bins = {}
+
+    def add(self, duration):
+        """Add a duration [s]"""
+        self.count += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        b = math.floor(math.log(duration) * self._LOG_SCALE) if duration > 0 else -10**6
+        self.bins[b] = self.bins.get(b, 0) + 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.
+
+    def percentile(self, p):
+        """Approximate p-th percentile (0-100) of the durations"""
+        if not self.count:
+            return 0.
+        target = p / 100 * self.count
+        cumulative = 0
+        for b in sorted(self.bins):
+            cumulative += self.bins[b]
+            if cumulative >= target:
+                # center of the bin, clipped to the real range
+                value = math.exp((b + 0.5) / self._LOG_SCALE)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def merge(self, other):
+        """Add the statistics of other to these ones"""
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        for b, n in other.bins.items():
+            self.bins[b] = self.bins.get(b, 0) + n
+        return self
+
+class _Section:
+    # context manager returned by ProfilingTimer.section, kept minimal for low overhead
+    __slots__ = ('_timer', '_name', '_path', '_start', '_id')
+
+    def __init__(self, timer, name):
+        self._timer = timer
+        self._name = name
+
+    def __enter__(self):
+        stack = self._timer._stack
+        self._path = (stack[-1] + (self._name,)) if stack else (self._name,)
+        stack.append(self._path)
+        recorder = self._timer._recorder
+        if recorder is not None:
+            self._id = recorder.section_id('/'.join(self._path))
+            recorder.begin(self._id)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._start
+        timer = self._timer
+        if timer._recorder is not None:
+            timer._recorder.end(self._id)
+        timer._stack.pop()
+        with timer._lock:
+            stats = timer.stats.get(self._path)
+            if stats is None:
+                stats = timer.stats[self._path] = SectionStats()
+            stats.add(duration)
+
+class ProfilingTimer(Timer):
+    """
+    Timer that also collects the statistics of named (and nested) sections 
+    of code, instead of printing each duration.
+
+    Parameters
+    ----------
+    see Timer, if a recorder is given, the start and the end of each section 
+    are also recorded in it
+
+    Methods
+    -------
+    section
+        context manager timing the code inside it:
+        with t.section('load'):
+            ...
+            with t.section('decode'): # nested, shown as load/decode
+                ...
+
+    profile
+        decorator timing every call of a function:
+        @t.profile()
+        def f(): ...
+
+    report
+        tree of the sections with count, total, mean, min, percentiles and max
+
+    export_csv
+        writes the report in a csv file
+
+    measure_overhead
+        time added by each section
+
+    The overhead of a section (enter + exit) is a few microseconds 
+    (about 3 us measured with CPython 3.11), use measure_overhead() to 
+    check it on the target machine. Laps are also recorded, each lap_name 
+    as a section.
+    """
+
+    def __init__(self, name="", text="{:0.4f} seconds", string_lap = 'lap  : ', 
+                 string_elap = 'elap : ', string_stop = 'stop : ', start = True, 
+                 recorder = None):
+        self.stats = {}
+        self._stack = []
+        # protects stats, so that they can be copied while another thread is timing
+        self._lock = threading.Lock()
+        super().__init__(name, text, string_lap, string_elap, string_stop, start, 
+                         recorder)
+
+    def section(self, name):
+        """Context manager timing the code inside it in the section name"""
+        return _Section(self, name)
+
+    def profile(self, name = None):
+        """Decorator timing every call of the function in the section name 
+        (by default, the name of the function)"""
+        def decorator(func):
+            sectionName = name or func.__qualname__
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with _Section(self, sectionName):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def lap(self, lap_name="", printTime = True):
+        """Report the elapsed time wrt the previous lap and record it in the section lap_name"""
+        current_lap = super().lap(lap_name, printTime)
+        path = (lap_name or 'lap',)
+        if self._stack:
+            path = self._stack[-1] + path
+        with self._lock:
+            self.stats.setdefault(path, SectionStats()).add(current_lap)
+        return current_lap
+
+    def clear(self):
+        """Remove all the collected statistics"""
+        with self._lock:
+            self.stats = {}
+
+    def snapshot(self):
+        """Copy of the statistics, consistent even if another thread is timing"""
+        with self._lock:
+            return {path: SectionStats().merge(st) for path, st in self.stats.items()}
+
+    def report_rows(self, percentiles = (50, 95, 99)):
+        """Rows of the report, each section after its parent"""
+        header = ['section', 'count', 'total', 'mean', 'min'] + \
+            ['p{}'.format(p) for p in percentiles] + ['max']
+        rows = []
+        for path in sorted(self.stats):
+            st = self.stats[path]
+            rows.append(['/'.join(path), st.count, st.total, st.mean, st.min] + 
+                        [st.percentile(p) for p in percentiles] + [st.max])
+        return header, rows
+
+    def report(self, percentiles = (50, 95, 99), printReport = True):
+        """Tree of the sections with their statistics, durations in ms"""
+        header, rows = self.report_rows(percentiles)
+        nameWidth = max([len('section')] + 
+                        [2*(len(path)-1) + len(path[-1]) for path in self.stats])
+        lines = ['{:{w}s} {:>8s}'.format(header[0], header[1], w = nameWidth) + 
+                 ''.join(' {:>10s}'.format(h) for h in header[2:])]
+        for path, row in zip(sorted(self.stats), rows):
+            label = '  '*(len(path)-1) + path[-1]
+            lines.append('{:{w}s} {:8d}'.format(label, row[1], w = nameWidth) + 
+                         ''.join(' {:10.4f}'.format(v*1000) for v in row[2:]))
+        text = '\n'.join(lines)
+        if self._name:
+            text = self._name + ' [ms]\n' + text
+        if printReport:
+            print(text)
+        return text
+
+    def export_csv(self, CSVfile, percentiles = (50, 95, 99)):
+        """Write the report (durations in s) in CSVfile"""
+        header, rows = self.report_rows(percentiles)
+        with open(CSVfile, 'w', encoding='UTF8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+    @staticmethod
+    def measure_overhead(n = 100000):
+        """Average time [s] added by one empty section"""
+        probe = ProfilingTimer(start = False)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with probe.section('overhead'):
+                pass
+        return (time.perf_counter() - t0) / n
+
+class TimingRegistry:
+    """
+    Collects section statistics from many threads and processes in a 
+    single report.
+
+    Each thread gets its own ProfilingTimer (timer()), so while timing a 
+    thread only takes the lock of its own timer, which is contended only 
+    during a snapshot. The statistics of all the threads are merged only when 
+    a snapshot or a report is requested. The statistics of other processes 
+    can be added with merge(), for example with the ones returned by 
+    export() in the worker or by a ProfiledTask.
+
+    Methods
+    -------
+    timer
+        ProfilingTimer of the calling thread
+
+    section
+        context manager timing a section in the calling thread
+
+    profile
+        decorator timing every call of a function in the calling thread
+
+    export
+        picklable statistics of this process, to be sent to the main process
+
+    merge
+        adds the statistics exported by another process
+
+    report
+        tree of the sections of all the threads and processes
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._timers = []
+        self._merged = {}
+
+    def _check_fork(self):
+        # a forked worker starts from empty statistics, not from a copy of the parent ones
+        if self._pid != os.getpid():
+            self._reset()
+
+    def timer(self):
+        """ProfilingTimer of the calling thread (created the first time)"""
+        self._check_fork()
+        timer = getattr(self._local, 'timer', None)
+        if timer is None:
+            timer = ProfilingTimer(name = threading.current_thread().name, start = False)
+            self._local.timer = timer
+            with self._lock:
+                self._timers.append(timer)
+        return timer
+
+    def section(self, name):
+        """Context manager timing the code inside it in the section name"""
+        return self.timer().section(name)
+
+    def profile(self, name = None):
+        """Decorator timing every call of the function in the section name 
+        of the calling thread (by default, the name of the function)"""
+        def decorator(func):
+            sectionName = name or func.__qualname__
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer().section(sectionName):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """Statistics of all the threads and of the merged processes, 
+        as a dictionary {path of the section: SectionStats}"""
+        self._check_fork()
+        with self._lock:
+            timers = list(self._timers)
+            stats = {path: SectionStats().merge(st) for path, st in self._merged.items()}
+        for timer in timers:
+            for path, st in timer.snapshot().items():
+                stats.setdefault(path, SectionStats()).merge(st)
+        return stats
+
+    def export(self, clear = False):
+        """Picklable statistics of this process (see snapshot), 
+        if clear, the collected statistics are removed"""
+        stats = self.snapshot()
+        if clear:
+            self.clear()
+        return stats
+
+    def merge(self, stats):
+        """Adds stats (as returned by export) to the statistics of this registry"""
+        with self._lock:
+            for path, st in stats.items():
+                self._merged.setdefault(path, SectionStats()).merge(st)
+
+    def clear(self):
+        """Remove all the collected statistics"""
+        with self._lock:
+            for timer in self._timers:
+                timer.clear()
+            self._merged = {}
+
+    def report(self, percentiles = (50, 95, 99), printReport = True):
+        """Tree of the sections of all the threads and processes, durations in ms"""
+        merged = ProfilingTimer(name = 'all threads and processes', start = False)
+        merged.stats = self.snapshot()
+        return merged.report(percentiles, printReport)
+
+    def export_csv(self, CSVfile, percentiles = (50, 95, 99)):
+        """Write the report (durations in s) in CSVfile"""
+        merged = ProfilingTimer(start = False)
+        merged.stats = self.snapshot()
+        merged.export_csv(CSVfile, percentiles)
+
+# registry shared by the whole process
+REGISTRY = TimingRegistry()
+
+class ProfiledTask:
+    """
+    Wraps a function to be executed in a worker process 
+    (ex. multiprocessing.Pool.map or concurrent.futures.ProcessPoolExecutor), 
+    timing it in the section name of REGISTRY of the worker.
+
+    Every call returns (result, stats) where stats are the statistics 
+    collected in the worker since the previous call. 
+    Use collect() in the main process to merge the stats in REGISTRY and 
+    get the results only:
+
+    results = ProfiledTask.collect(pool.map(ProfiledTask(func), items))
+
+    func must be picklable (defined at the top level of a module)
+    """
+
+    def __init__(self, func, name = None):
+        self.func = func
+        self.name = name or func.__qualname__
+
+    def __call__(self, *args, **kwargs):
+        with REGISTRY.section(self.name):
+            result = self.func(*args, **kwargs)
+        return result, REGISTRY.export(clear = True)
+
+    @staticmethod
+    def collect(resultsAndStats, registry = None):
+        """Merges the stats in registry (REGISTRY by default) and returns the list of results"""
+        registry = REGISTRY if registry is None else registry
+        results = []
+        for result, stats in resultsAndStats:
+            registry.merge(stats)
+            results.append(result)
+        return results
+
 #%% just to figure out how does it work
 if __name__ == '__main__':
     this_timer = Timer(name = 'test timer')
@@ -135,3 +662,30 @@ if __name__ == '__main__':
         this_timer.elap(elap_name= 'it {}'.format(i), printTime = True)
         time.sleep(0.1)
     this_timer.stop()
+
+    profiler = ProfilingTimer(name = 'test profiler')
+    for i in range(1000):
+        with profiler.section('frame'):
+            with profiler.section('acquire'):
+                time.sleep(0.0001)
+            with profiler.section('process'):
+                sum(range(1000))
+    profiler.report()
+
+    # snapshots taken while other threads are timing
+    def worker():
+        for i in range(20000):
+            with REGISTRY.section('work'):
+                pass
+    threads = [threading.Thread(target = worker) for i in range(4)]
+    for t in threads:
+        t.start()
+    while any(t.is_alive() for t in threads):
+        snapshot = REGISTRY.snapshot()
+        for st in snapshot.values():
+            assert st.count == sum(st.bins.values()), 'inconsistent snapshot'
+    for t in threads:
+        t.join()
+    assert REGISTRY.snapshot()[('work',)].count == 80000
+    REGISTRY.report()
+    print('overhead per section: {:.3f} us'.format(profiler.measure_overhead()*1e6))
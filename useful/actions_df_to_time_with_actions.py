@@ -1,16 +1,113 @@
 import pandas as pd
+import numpy as np
 import datetime
+import numbers
+import re
 
 def convert_timestring_to_seconds(string, fmt = '%M:%S.%f'):
     pt = datetime.datetime.strptime(string, fmt)
     return pt.microsecond/10**6 + pt.second + pt.minute*60 + pt.hour*3600
     
 
+# directives of the formats that can be parsed in a vectorized way
+_TIME_DIRECTIVES = {'%H': r'(?P<H>\d{1,2})', '%M': r'(?P<M>\d{1,2})', 
+                    '%S': r'(?P<S>\d{1,2})', '%f': r'(?P<f>\d{1,6})'}
+_TIME_MAX_VALUES = {'H': 23, 'M': 59, 'S': 61}
+
+def _timestring_regex(fmt):
+    # regex equivalent to fmt, None if fmt contains other directives
+    pattern = ''
+    used = set()
+    for token in re.split(r'(%.)', fmt):
+        if token in _TIME_DIRECTIVES and token not in used:
+            pattern += _TIME_DIRECTIVES[token]
+            used.add(token)
+        elif token.startswith('%') and len(token) == 2:
+            return None
+        else:
+            pattern += re.escape(token)
+    return '^' + pattern + '$'
+
+def _safe_convert_timestring_to_seconds(string, fmt):
+    # only malformed strings become nan, other types raise TypeError as strptime
+    try:
+        return convert_timestring_to_seconds(string, fmt)
+    except ValueError:
+        return np.nan
+
+def timestrings_to_seconds(values, fmt = '%M:%S.%f'):
+    '''
+    Vectorized version of convert_timestring_to_seconds for a whole column.
+
+    Each different timestring is parsed only once. Formats made of %H, %M, 
+    %S, %f and separators (ex. '%M:%S.%f', '%H:%M:%S') are parsed all at once 
+    with a regex, the other ones with datetime.strptime. 
+    Malformed timestrings become np.nan instead of raising an error. 
+    Numbers (ex. a column already converted) are kept as they are, the other 
+    types raise a TypeError.
+
+    Parameters
+    ----------
+    values : pandas series, list or np.array of strings
+        timestrings to be converted (numbers are considered already converted).
+    fmt : string, optional
+        format of conversion from timestring to seconds. The default is '%M:%S.%f'.
+
+    Returns
+    -------
+    np.array of float
+        seconds.microseconds of each timestring.
+
+    '''
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        # already converted
+        return values.to_numpy(dtype = float)
+
+    codes, uniques = pd.factorize(values.astype(object))
+    uniques = pd.Series(uniques, dtype = object)
+    seconds = np.full(len(uniques), np.nan)
+    isNumber = np.array([isinstance(v, numbers.Real) and not isinstance(v, bool) for v in uniques], 
+                        dtype = bool)
+    seconds[isNumber] = uniques[isNumber].astype(float)
+    isString = np.array([isinstance(v, str) for v in uniques], dtype = bool)
+
+    regex = _timestring_regex(fmt)
+    if regex is not None:
+        parts = uniques.astype(str).str.extract(regex)
+        valid = np.array(parts.notna().all(axis = 1)) & isString
+        for field, maxValue in _TIME_MAX_VALUES.items():
+            if field in parts:
+                fieldValues = pd.to_numeric(parts[field]).to_numpy()
+                valid &= ~(fieldValues > maxValue)
+        total = np.zeros(len(uniques))
+        for field, factor in [('H', 3600), ('M', 60), ('S', 1)]:
+            if field in parts:
+                total += pd.to_numeric(parts[field]).fillna(0).to_numpy() * factor
+        if 'f' in parts:
+            # as strptime, '5' means 500000 microseconds
+            total += pd.to_numeric(parts['f'].fillna('0').str.ljust(6, '0')).to_numpy() / 10**6
+        seconds[valid] = total[valid]
+        toBeParsed = ~valid & ~isNumber
+    else:
+        toBeParsed = ~isNumber
+
+    # the ones not matching the regex are tried with strptime
+    for i in np.flatnonzero(toBeParsed):
+        seconds[i] = _safe_convert_timestring_to_seconds(uniques[i], fmt)
+
+    # missing values (code -1) are nan
+    return np.where(codes >= 0, seconds[codes], np.nan)
+
 def df_convert_timestring_to_seconds(df, time_cols, fmt = '%M:%S.%f'):
     '''
     Converts all the columns of df listed in time_cols from the format 
     declared with fmt to seconds.microseconds
 
+    Each column is converted at once with timestrings_to_seconds, 
+    malformed timestrings become np.nan. Columns already converted are 
+    left as they are, so it can be called again on the same df.
+
     Parameters
     ----------
     df : pandas df
@@ -28,14 +125,13 @@ def df_convert_timestring_to_seconds(df, time_cols, fmt = '%M:%S.%f'):
     '''
     for col in list(df):
         if col in time_cols:
-            for i in df.index:
-                df.loc[i,col] = convert_timestring_to_seconds(df.loc[i,col],fmt) 
+            df[col] = timestrings_to_seconds(df[col], fmt)
     return df
 
 
 def from_TIMES_to_ACTION01_for_each_time(time_df, actions_df, time_col = 'time', 
                                          actions_col = 'action', start_time_col = 'start_time', 
-                                         end_time_col = 'end_time'):
+                                         end_time_col = 'end_time', output = 'dense'):
     '''
     Given two dataframes:
         time_df, contains a column with all the time values, as declare in time_col
@@ -51,6 +147,10 @@ def from_TIMES_to_ACTION01_for_each_time(time_df, actions_df, time_col = 'time',
     1: there is at least one row in action_df in which the time corresponding to that row 
     is between a start_time and an end_time of that action
 
+    The times are sorted once, the first and the last time of each interval 
+    are found with np.searchsorted and the intervals are painted with the 
+    cumulative sum of a difference array: O((N+M) log N) instead of O(N*M).
+
     Parameters
     ----------
     time_df : pandas df
@@ -65,26 +165,171 @@ def from_TIMES_to_ACTION01_for_each_time(time_df, actions_df, time_col = 'time',
         name of the column in actions_df the start time values. The default is 'start_time'.
     end_time_col : TYPE, optional
         name of the column in actions_df the end time values. The default is 'end_time'.
+    output : string, optional
+        'dense': a column of 0/1 for each action.
+        'sparse': a column of 0/1 for each action, stored as pandas sparse arrays.
+        'categorical': a single column actions_col with the active action of 
+        each row (actions active at the same time are joined with '+', 
+        NaN if no action is active).
+        The default is 'dense'.
 
     Returns
     -------
     df : pandas df
-        DESCRIPTION.
+        time_col and the action columns (or the actions_col column if categorical).
 
     '''
+    validOutputs = ['dense', 'sparse', 'categorical']
+    assert output in validOutputs, f"output not valid, possible values are: {validOutputs}"
+
+    times = time_df[time_col].to_numpy(dtype = float)
+    actions = actions_df[actions_col].unique()
+    active = _activeMatrix(times, actions_df, actions, actions_col, start_time_col, end_time_col)
+
     # creates a new df with only the time values
     df = pd.DataFrame({time_col:time_df[time_col].values})
-    # for every action, creates a column with only 0s 
-    for action in actions_df[actions_col].unique():
-        df[action] = 0
-    # for each row of actions_df, get action start and end time
-    for i in actions_df.index:
-        action = actions_df[actions_col][i]
-        start_time_seconds = actions_df[start_time_col][i]
-        end_time_seconds = actions_df[end_time_col][i]
-        # for each element of the column time, check if it is between start and end time. 
-        # if yes, make it 1 and not 0
-        for j in df.index:
-            if df[time_col][j] >= start_time_seconds and df[time_col][j] <= end_time_seconds:
-                df.loc[j,action] = 1   
-    return df
\ No newline at end of file
+    if output == 'categorical':
+        combinations, codes = np.unique(active, axis = 0, return_inverse = True)
+        labels = ['+'.join(str(a) for a, on in zip(actions, comb) if on) for comb in combinations]
+        # rows without any active action are NaN
+        codes = np.asarray(codes).reshape(-1)
+        if '' in labels:
+            empty = labels.index('')
+            codes = np.where(codes == empty, -1, codes - (codes > empty))
+            labels.remove('')
+        df[actions_col] = pd.Categorical.from_codes(codes, categories = labels)
+        return df
+    for i, action in enumerate(actions):
+        column = active[:, i].astype(np.int64)
+        if output == 'sparse':
+            column = pd.arrays.SparseArray(column, fill_value = 0)
+        df[action] = column
+    return df
+
+def _activeMatrix(times, actions_df, actions, actions_col, start_time_col, end_time_col):
+    # boolean matrix len(times) x len(actions): True if time is in [start, end] of that action
+    nTimes = len(times)
+    order = np.argsort(times, kind = 'stable')
+    sortedTimes = times[order]
+    names = actions_df[actions_col].to_numpy()
+    starts = actions_df[start_time_col].to_numpy(dtype = float)
+    ends = actions_df[end_time_col].to_numpy(dtype = float)
+    # first and (last+1) index of each interval in the sorted times
+    firsts = np.searchsorted(sortedTimes, starts, side = 'left')
+    lasts = np.searchsorted(sortedTimes, ends, side = 'right')
+    valid = (firsts < lasts) & ~np.isnan(starts) & ~np.isnan(ends)
+
+    active = np.zeros((nTimes, len(actions)), dtype = bool)
+    for i, action in enumerate(actions):
+        rows = valid & (names == action)
+        # difference array: +1 where an interval starts, -1 after it ends
+        diff = np.bincount(firsts[rows], minlength = nTimes+1) - \
+            np.bincount(lasts[rows], minlength = nTimes+1)
+        active[order, i] = np.cumsum(diff[:nTimes]) > 0
+    return active
+
+class ActionsIntervalIndex:
+    '''
+    Index of the intervals of an actions_df (action, start_time, end_time), 
+    built once, to answer in a vectorized way:
+        - which actions are active at each time of an array (active_at)
+        - which intervals contain a time (intervals_at)
+        - which intervals overlap a time range (intervals_overlapping)
+        - which times fall in an action (times_in_action)
+
+    The start and end times of each action are kept sorted: the number of 
+    intervals of an action containing t is 
+    (number of starts <= t) - (number of ends < t), found with np.searchsorted, 
+    so each query costs O(log M) per time. Intervals are closed [start, end], 
+    as in from_TIMES_to_ACTION01_for_each_time, intervals with NaN or with 
+    start_time > end_time are ignored.
+
+    Parameters
+    ----------
+    actions_df : pandas df
+        three columns "action", "start_time", "end_time"
+    actions_col : string, optional
+        name of the column in actions_df the action names. The default is 'action'.
+    start_time_col : string, optional
+        name of the column in actions_df the start time values. The default is 'start_time'.
+    end_time_col : string, optional
+        name of the column in actions_df the end time values. The default is 'end_time'.
+    '''
+
+    def __init__(self, actions_df, actions_col = 'action', start_time_col = 'start_time', 
+                 end_time_col = 'end_time'):
+        starts = actions_df[start_time_col].to_numpy(dtype = float)
+        ends = actions_df[end_time_col].to_numpy(dtype = float)
+        valid = ~np.isnan(starts) & ~np.isnan(ends) & (starts <= ends)
+
+        self.actions = actions_df[actions_col].unique()
+        self.index = actions_df.index.to_numpy()[valid]
+        self.names = actions_df[actions_col].to_numpy()[valid]
+        self.starts = starts[valid]
+        self.ends = ends[valid]
+
+        # all the intervals sorted by start, for the queries on the intervals
+        self._byStart = np.argsort(self.starts, kind = 'stable')
+        self._sortedStarts = self.starts[self._byStart]
+        # starts and ends of each action sorted independently, for counting
+        self._actionStarts = []
+        self._actionEnds = []
+        for action in self.actions:
+            rows = self.names == action
+            self._actionStarts.append(np.sort(self.starts[rows]))
+            self._actionEnds.append(np.sort(self.ends[rows]))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def count_at(self, times):
+        '''
+        Number of intervals of each action containing each time
+
+        Returns
+        -------
+        np.array of int
+            len(times) x len(actions)
+        '''
+        times = np.atleast_1d(np.asarray(times, dtype = float))
+        counts = np.zeros((len(times), len(self.actions)), dtype = np.int64)
+        for i, (starts, ends) in enumerate(zip(self._actionStarts, self._actionEnds)):
+            counts[:, i] = np.searchsorted(starts, times, side = 'right') - \
+                np.searchsorted(ends, times, side = 'left')
+        return counts
+
+    def active_at(self, times, asDataFrame = False):
+        '''
+        Bulk stabbing query: for each time, which actions are active
+
+        Returns
+        -------
+        np.array of bool (len(times) x len(actions)) or pandas df 
+        with a column for each action if asDataFrame
+        '''
+        active = self.count_at(times) > 0
+        if asDataFrame:
+            return pd.DataFrame(active, columns = self.actions)
+        return active
+
+    def actions_at(self, time):
+        '''List of the actions active at time'''
+        return [action for action, on in zip(self.actions, self.active_at(time)[0]) if on]
+
+    def intervals_at(self, time):
+        '''Indexes (of actions_df) of the intervals containing time'''
+        return self.intervals_overlapping(time, time)
+
+    def intervals_overlapping(self, startTime, endTime):
+        '''Indexes (of actions_df) of the intervals overlapping [startTime, endTime]'''
+        # only the intervals starting before endTime can overlap
+        candidates = self._byStart[:np.searchsorted(self._sortedStarts, endTime, side = 'right')]
+        candidates = candidates[self.ends[candidates] >= startTime]
+        return self.index[np.sort(candidates)]
+
+    def times_in_action(self, times, action):
+        '''Boolean mask of the times falling in at least one interval of action'''
+        i = list(self.actions).index(action)
+        times = np.asarray(times, dtype = float)
+        return (np.searchsorted(self._actionStarts[i], times, side = 'right') - 
+                np.searchsorted(self._actionEnds[i], times, side = 'left')) > 0
@@ -5,8 +5,6 @@ Created on Tue Mar 28 23:07:42 2023
 @author: eferlius
 """
 import os
-import cv2
-import config
 import basic
 import pandas as pd
 import time
@@ -14,96 +12,492 @@ import datetime
 import numpy as np
 import shutil
 import logging
+import json
+import threading
+import hashlib
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 
 def find_closest_to_value_in_array(value, array):
-    idx = np.where(np.abs(array-value) == np.min(np.abs(array-value)))[0]
-    min_diff = array[idx]-value
-    
-    if len(idx)>1 or len(min_diff)>1:
-        raise Exception("more than one value found in find_closest_index")
-    return idx[0], array[idx][0], min_diff[0]
+    '''
+    Returns index, value and difference (array[index]-value) of the element 
+    of array closest to value. On ties, the smallest element is chosen
+    '''
+    idx, values, diffs = match_closest_in_array([value], array)
+    return idx[0], values[0], diffs[0]
+
+def _closest_in_sorted(values, sortedArray):
+    # position in sortedArray of the closest element to each value (ties -> smaller one)
+    pos = np.searchsorted(sortedArray, values)
+    left = np.clip(pos-1, 0, len(sortedArray)-1)
+    right = np.clip(pos, 0, len(sortedArray)-1)
+    takeRight = np.abs(sortedArray[right]-values) < np.abs(sortedArray[left]-values)
+    return np.where(takeRight, right, left)
+
+def match_closest_in_array(values, array, tolerance = None, oneToOne = False):
+    '''
+    For each element of values, finds the closest element of array.
+    array is sorted once and all the values are matched with a single 
+    np.searchsorted, instead of scanning array for each value.
+
+    Parameters
+    ----------
+    values : list or np.array
+        values to be matched (ex. modification time of the files).
+    array : list or np.array
+        possible matches (ex. moments on the csv file).
+    tolerance : float, optional
+        if specified, a value is matched only if abs(difference) < tolerance.
+        The default is None.
+    oneToOne : bool, optional
+        if True, each element of array is matched to at most one value: 
+        the closest values are assigned first, the others get their closest 
+        still available element. The default is False.
+
+    Returns
+    -------
+    tuple of 3 np.arrays, one element for each value
+        idx: index in array of the match, -1 if not matched
+        matched: array[idx], nan if not matched
+        diff: array[idx]-value, nan if not matched
+    '''
+    values = np.asarray(values, dtype = float)
+    array = np.asarray(array, dtype = float)
+    order = np.argsort(array, kind = 'stable')
+    sortedArray = array[order]
+    idx = np.full(len(values), -1)
+
+    if len(array):
+        if not oneToOne:
+            idx = order[_closest_in_sorted(values, sortedArray)]
+        else:
+            pending = np.arange(len(values))
+            available = np.arange(len(array)) # positions in sortedArray
+            while len(pending) and len(available):
+                pos = available[_closest_in_sorted(values[pending], sortedArray[available])]
+                absDiff = np.abs(sortedArray[pos] - values[pending])
+                if tolerance is not None:
+                    inTolerance = absDiff < tolerance
+                    pending, pos, absDiff = pending[inTolerance], pos[inTolerance], absDiff[inTolerance]
+                # for each claimed element, the closest value wins
+                byDiff = np.argsort(absDiff, kind = 'stable')
+                _, winners = np.unique(pos[byDiff], return_index = True)
+                winners = byDiff[winners]
+                idx[pending[winners]] = order[pos[winners]]
+                available = np.setdiff1d(available, pos[winners], assume_unique = True)
+                pending = np.delete(pending, winners)
+
+    matched = np.where(idx >= 0, array[idx] if len(array) else np.nan, np.nan)
+    diff = matched - values
+    if tolerance is not None:
+        outside = ~(np.abs(diff) < tolerance)
+        idx[outside] = -1
+        matched[outside] = np.nan
+        diff[outside] = np.nan
+    return idx, matched, diff
 
 def get_video_duration(filename):
-    video = cv2.VideoCapture(filename)
-    fps = video.get(cv2.CAP_PROP_FPS)
-    frame_count = video.get(cv2.CAP_PROP_FRAME_COUNT)
-    seconds = frame_count / fps
+    # read from the container metadata, OpenCV only for the non MP4/MOV files
+    seconds = basic.video_probe.probe_video(filename)['duration']
     minutes = int(seconds / 60)
     rem_sec = int(seconds % 60)
     return f"{minutes}:{rem_sec}"
 
-LOG_NAME = 'log file renamer.txt'
-logging.basicConfig(format='%(asctime)s %(levelname)-8s [%(lineno)-4d] %(filename)s \n>>> %(message)s', \
-                        datefmt='%Y-%m-%d %H:%M:%S',  filename = LOG_NAME, level = logging.INFO, force = True)
-
-    
-POSSIBLE_ACTIONS = ['move', 'copy2']       
-ACTION = 'move' 
-
-# all the files will be taken from INPUT_DIR
-INPUT_DIR = r'C:\Users\eferlius\Desktop\to be sorted'
-LIST_EXT = ['.MOV']
-# and will be moved in DEST_DIR
-DEST_DIR = r'G:\Shared drives\HandWash\Tests\20230327\01_raw\iphone11'
-# the file will be renamed from the name they have in INPUT_DIR
-TEST_DATE = '20230327'
-# csv file containing 
-# - the future name of each file
-# - a column with the time information that will be used to find the match of the files in INPUT_DIR
-CSV_FILE = os.path.join(config.D['DIR']['00_p'].replace('DUMMY',TEST_DATE),'tests log.csv')
-COL_NAME_ON_CSV = 'testCode'
-COL_TIME_ON_CSV = 'stop_rec'
-COL_NAME_ON_CSV_FMT = '%Y-%m-%d %H-%M-%S'
-
-# process will be executed only if the time difference between the file in INPUT_DIR
-# and the value in COL_TIME_ON_CSV is lower than
-VALID_THRESH = 5 #s
-
-# list of files in INPUT_DIR to be moved 
-files, dirs = basic.utils.find_files_and_dirs_in_dir(INPUT_DIR, listExt = LIST_EXT)
-
-# list of moments on csv file
-df = pd.read_csv(CSV_FILE)
-list_moments = []
-for moment in df[COL_TIME_ON_CSV].values:
+POSSIBLE_ACTIONS = ['move', 'copy2']
+# suffix of the files being copied, renamed to the final name only when complete
+PARTIAL_SUFFIX = '.part'
+# size of the blocks read when hashing and copying
+HASH_CHUNK_SIZE = 8*1024*1024
+
+def read_csv_moments(csvFile, colTime, timeFmt):
+    '''
+    Reads csvFile and converts the timestrings of colTime (in timeFmt) to 
+    timestamps, 0 if not valid. Returns the dataframe and the timestamps
+    '''
+    df = pd.read_csv(csvFile)
+    list_moments = []
+    for moment in df[colTime].values:
+        try:
+            list_moments.append(time.mktime(datetime.datetime.strptime(moment, timeFmt).timetuple()))
+        except:
+            list_moments.append(0)
+    return df, np.array(list_moments)
+
+def plan_from_csv(inputDir, destDir, csvFile, colName, colTime, timeFmt, 
+                  listExt = [''], validThresh = 5, oneToOne = True):
+    '''
+    Computes up front the plan of the files in inputDir to be moved in destDir, 
+    matching the modification time of each file with the moments in colTime 
+    of csvFile. The new name of the file is the value in colName 
+    (with the original extension).
+
+    Parameters
+    ----------
+    inputDir : string
+        directory containing the files.
+    destDir : string
+        directory where the files will be moved.
+    csvFile : string
+        csv file with the future name and the time information of each file.
+    colName : string
+        column of csvFile with the future name of each file.
+    colTime : string
+        column of csvFile with the time information.
+    timeFmt : string
+        format of the values in colTime.
+    listExt : list, optional
+        extensions of the files to be considered. The default is [''].
+    validThresh : float, optional
+        a file is matched only if the time difference is lower than validThresh [s]. 
+        The default is 5.
+    oneToOne : bool, optional
+        two files can't be matched with the same row. The default is True.
+
+    Returns
+    -------
+    plan : list of (source, destination) tuples
+        files to be moved.
+    skipped : list of (source, difference) tuples
+        files without a match.
+
+    '''
+    files, _ = basic.utils.find_files_and_dirs_in_dir(inputDir, listExt = listExt)
+    df, array_moments = read_csv_moments(csvFile, colTime, timeFmt)
+
+    # match all the files at once, use the modified time of the file
+    files_moments = np.array([os.path.getmtime(f) for f in files])
+    files_idx, files_values, files_diffs = match_closest_in_array(files_moments, array_moments, 
+        tolerance = validThresh, oneToOne = oneToOne)
+
+    plan = []
+    skipped = []
+    for f, moment, idx, value, min_diff in zip(files, files_moments, files_idx, files_values, files_diffs):
+        file_name = os.path.split(f)[-1]
+        if idx >= 0:
+            new_name = df[colName].values[idx]+os.path.splitext(f)[-1]
+            plan.append((f, os.path.join(destDir, new_name)))
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                logging.debug('{} [{} s] @{} -> {} @{}'.format(file_name, get_video_duration(f), 
+                              datetime.datetime.fromtimestamp(moment), new_name, 
+                              datetime.datetime.fromtimestamp(value)))
+        else:
+            skipped.append((f, min_diff))
+            logging.info('NOT moved ...\\{} since no moment within +-{} s'.format(file_name, validThresh))
+    return plan, skipped
+
+class TransferJournal:
+    '''
+    Append-only journal (one json line per completed transfer) used to 
+    resume an interrupted execute_plan without transferring again the 
+    files already done
+
+    Parameters
+    ----------
+    journalFile : string
+        complete path to the journal file, created if not existing.
+    '''
+
+    def __init__(self, journalFile):
+        self.journalFile = journalFile
+        self._lock = threading.Lock()
+        self.done = set()
+        if os.path.isfile(journalFile):
+            with open(journalFile, encoding = 'UTF8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError: # line truncated by the interruption
+                        continue
+                    self.done.add((entry['src'], entry['dst']))
+
+    def is_done(self, src, dst):
+        return (src, dst) in self.done
+
+    def add(self, src, dst, action, **info):
+        '''Records the transfer from src to dst as completed'''
+        entry = dict(src = src, dst = dst, action = action, 
+                     time = basic.utils.this_moment(), **info)
+        with self._lock:
+            with open(self.journalFile, 'a', encoding = 'UTF8') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.done.add((src, dst))
+
+def _new_hash():
+    return hashlib.blake2b(digest_size = 32)
+
+def hash_file(path, chunkSize = HASH_CHUNK_SIZE):
+    '''BLAKE2b digest (hex) of the file in path, read through a memory map'''
+    h = _new_hash()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return h.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for start in range(0, len(view), chunkSize):
+                    h.update(view[start:start+chunkSize])
+            finally:
+                view.release()
+    return h.hexdigest()
+
+def copy_with_hash(src, dst, chunkSize = HASH_CHUNK_SIZE):
+    '''
+    Copies src in dst (with metadata, as shutil.copy2) and computes the 
+    BLAKE2b digest of the copied data at the same time, so the data is read 
+    only once. Returns the digest (hex)
+    '''
+    h = _new_hash()
+    buffer = bytearray(chunkSize)
+    view = memoryview(buffer)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        while True:
+            n = fsrc.readinto(buffer)
+            if not n:
+                break
+            h.update(view[:n])
+            fdst.write(view[:n])
+    shutil.copystat(src, dst)
+    return h.hexdigest()
+
+class HashIndex:
+    '''
+    Index of the digests of the files (json file), so that they are computed 
+    only once: an entry is valid while size and modification time of the 
+    file don't change.
+
+    Used by transfer_file to skip the files already present at the destination 
+    and to verify the copies against the digest of the source.
+
+    Parameters
+    ----------
+    indexFile : string
+        complete path to the index, created if not existing.
+    '''
+
+    def __init__(self, indexFile):
+        self.indexFile = indexFile
+        self._lock = threading.Lock()
+        self.files = {}
+        if os.path.isfile(indexFile):
+            with open(indexFile, encoding = 'UTF8') as f:
+                self.files = json.load(f)
+
+    def lookup(self, path):
+        '''Digest of path if indexed and not modified since, otherwise None'''
+        entry = self.files.get(os.path.abspath(path))
+        if entry is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if st.st_size != entry['size'] or st.st_mtime != entry['mtime']:
+            return None
+        return entry['digest']
+
+    def record(self, path, digest):
+        st = os.stat(path)
+        with self._lock:
+            self.files[os.path.abspath(path)] = dict(size = st.st_size, mtime = st.st_mtime, 
+                                                     digest = digest)
+
+    def forget(self, path):
+        with self._lock:
+            self.files.pop(os.path.abspath(path), None)
+
+    def digest(self, path):
+        '''Digest of path, from the index or computed (and recorded)'''
+        digest = self.lookup(path)
+        if digest is None:
+            digest = hash_file(path)
+            self.record(path, digest)
+        return digest
+
+    def save(self):
+        with self._lock:
+            folder = os.path.split(self.indexFile)[0]
+            if folder:
+                os.makedirs(folder, exist_ok = True)
+            tmp = self.indexFile + PARTIAL_SUFFIX
+            with open(tmp, 'w', encoding = 'UTF8') as f:
+                json.dump(self.files, f)
+            os.replace(tmp, self.indexFile)
+
+def is_same_device(src, destDir):
+    '''True if src and destDir are on the same device, so a move is a cheap rename'''
     try:
-        list_moments.append(time.mktime(datetime.datetime.strptime(moment, COL_NAME_ON_CSV_FMT).timetuple()))
-    except:
-        list_moments.append(0)
-array_moments = np.array(list_moments)
-
-assert ACTION in POSSIBLE_ACTIONS, 'got invalid command ({})'.format(ACTION)
-
-counter = 0
-logging.debug('='*20)
-logging.debug('moving from folder {} to folder {}'.format(INPUT_DIR, DEST_DIR))
-for f in files:
-    
-    file_name = os.path.split(f)[-1]
-    #use the modified time of the file
-    moment = os.path.getmtime(f) 
-    idx, value, min_diff = find_closest_to_value_in_array(moment, array_moments)
-    if abs(min_diff) < VALID_THRESH:
-        counter+=1
-        new_name = df[COL_NAME_ON_CSV].values[idx]+os.path.splitext(f)[-1]
-        new_path = os.path.join(DEST_DIR,new_name)
-        if ACTION == 'move':
-            shutil.move(f, new_path)
-            logging.info('moved ...\{} to ...\{}'.format(file_name,new_name))
-        elif ACTION == 'copy2':
-            shutil.copy2(f, new_path)
-            logging.info('copied ...\{} to ...\{}'.format(file_name,new_name))
+        return os.stat(src).st_dev == os.stat(destDir).st_dev
+    except OSError:
+        return False
+
+def transfer_file(src, dst, action = 'move', hashIndex = None):
+    '''
+    Moves (action = 'move') or copies with metadata (action = 'copy2') src to dst.
+
+    A move on the same device is a rename. Otherwise the data is copied 
+    in dst + PARTIAL_SUFFIX and renamed to dst only when complete, so an 
+    interrupted transfer never leaves a truncated dst.
+
+    If a HashIndex is given:
+    - if dst already exists with the same size of src, both are hashed 
+      (if not indexed yet) and, if the digests are the same, nothing is done
+    - the data is hashed while being copied and the copy is verified by 
+      hashing it (memory-mapped) before renaming it to dst: its digest must 
+      be the one of the data read and, if src was already indexed, the 
+      indexed one
+    - the digests of src and dst are recorded in the index
+
+    Returns
+    -------
+    string
+        'renamed', 'moved', 'copied' or 'skipped'.
+    '''
+    assert action in POSSIBLE_ACTIONS, 'got invalid command ({})'.format(action)
+    destDir = os.path.split(dst)[0]
+    os.makedirs(destDir, exist_ok = True)
+
+    srcDigest = None
+    if hashIndex is not None:
+        srcDigest = hashIndex.lookup(src)
+        # maybe already at the destination: with the same size, compare the contents
+        if os.path.isfile(dst) and os.path.getsize(dst) == os.path.getsize(src):
+            srcDigest = hashIndex.digest(src)
+            if srcDigest == hashIndex.digest(dst):
+                if action == 'move':
+                    os.remove(src)
+                    hashIndex.forget(src)
+                return 'skipped'
+
+    if action == 'move' and is_same_device(src, destDir):
+        os.replace(src, dst)
+        if srcDigest is not None:
+            hashIndex.forget(src)
+            hashIndex.record(dst, srcDigest)
+        return 'renamed'
+
+    partial = dst + PARTIAL_SUFFIX
+    if hashIndex is None:
+        shutil.copy2(src, partial)
     else:
-        logging.info('NOT moved ...\{} to ...\{} since diff = {} with threshold set at +-{}'.format(file_name, new_name, min_diff, VALID_THRESH))
+        digest = copy_with_hash(src, partial)
+        expected = srcDigest if srcDigest is not None else digest
+        if digest != expected or hash_file(partial) != expected:
+            os.remove(partial)
+            raise IOError('digest of the copy of {} differs from the one of the source'.format(src))
+    os.replace(partial, dst)
+    if hashIndex is not None:
+        hashIndex.record(dst, digest)
+        if action == 'copy2':
+            hashIndex.record(src, digest)
+        else:
+            hashIndex.forget(src)
+    if action == 'move':
+        os.remove(src)
+        return 'moved'
+    return 'copied'
+
+def execute_plan(plan, action = 'move', maxWorkers = 4, journalFile = None, 
+                 hashIndexFile = None):
+    '''
+    Executes all the transfers of plan in a thread pool with at most 
+    maxWorkers transfers at the same time.
+
+    If journalFile is specified, every completed transfer is recorded in it 
+    and the transfers already recorded are skipped, so the same call can be 
+    repeated to continue an interrupted execution.
+
+    Parameters
+    ----------
+    plan : list of (source, destination) tuples
+        as returned by plan_from_csv.
+    action : string, optional
+        'move' or 'copy2'. The default is 'move'.
+    maxWorkers : int, optional
+        maximum number of transfers at the same time. The default is 4.
+    journalFile : string, optional
+        complete path to the journal. The default is None (no journal).
+    hashIndexFile : string, optional
+        complete path to the HashIndex used to skip the files already at the 
+        destination and to verify the copies, see transfer_file. 
+        The default is None (no hashing).
+
+    Returns
+    -------
+    dict
+        {(source, destination): 'renamed', 'moved', 'copied', 'skipped' or the exception raised}
+
+    '''
+    assert action in POSSIBLE_ACTIONS, 'got invalid command ({})'.format(action)
+    journal = TransferJournal(journalFile) if journalFile else None
+    hashIndex = HashIndex(hashIndexFile) if hashIndexFile else None
+
+    def job(src, dst):
+        if journal is not None and journal.is_done(src, dst):
+            return 'skipped'
+        if action == 'move' and not os.path.exists(src) and os.path.exists(dst):
+            # moved before an interruption, but not recorded
+            result = 'skipped'
+        else:
+            result = transfer_file(src, dst, action, hashIndex)
+        logging.info('{} ...\\{} to ...\\{}'.format(result, os.path.split(src)[-1], os.path.split(dst)[-1]))
+        if journal is not None:
+            digest = hashIndex.lookup(dst) if hashIndex is not None else None
+            journal.add(src, dst, action, result = result, digest = digest)
+        return result
+
+    results = {}
+    with ThreadPoolExecutor(max_workers = maxWorkers) as executor:
+        futures = {executor.submit(job, src, dst): (src, dst) for src, dst in plan}
+        for future, pair in futures.items():
+            try:
+                results[pair] = future.result()
+            except Exception as e:
+                logging.error('failed {} -> {}: {}'.format(pair[0], pair[1], e))
+                results[pair] = e
+    if hashIndex is not None:
+        hashIndex.save()
+    return results
+
+if __name__ == '__main__':
+    import config
 
-    logging.debug('='*10)
-    logging.debug('{} [{} s] @{}'.format(file_name, get_video_duration(new_path), format(datetime.datetime.fromtimestamp(moment))))
-    logging.debug('{} @{}'.format(new_name, format(datetime.datetime.fromtimestamp(value))))
-    
-logging.info('tot: {} files'.format(counter))        
+    LOG_NAME = 'log file renamer.txt'
+    logging.basicConfig(format='%(asctime)s %(levelname)-8s [%(lineno)-4d] %(filename)s \n>>> %(message)s', \
+                            datefmt='%Y-%m-%d %H:%M:%S',  filename = LOG_NAME, level = logging.INFO, force = True)
 
-    
-    
+    ACTION = 'move' 
 
+    # all the files will be taken from INPUT_DIR
+    INPUT_DIR = r'C:\Users\eferlius\Desktop\to be sorted'
+    LIST_EXT = ['.MOV']
+    # and will be moved in DEST_DIR
+    DEST_DIR = r'G:\Shared drives\HandWash\Tests\20230327\01_raw\iphone11'
+    # the file will be renamed from the name they have in INPUT_DIR
+    TEST_DATE = '20230327'
+    # csv file containing 
+    # - the future name of each file
+    # - a column with the time information that will be used to find the match of the files in INPUT_DIR
+    CSV_FILE = os.path.join(config.D['DIR']['00_p'].replace('DUMMY',TEST_DATE),'tests log.csv')
+    COL_NAME_ON_CSV = 'testCode'
+    COL_TIME_ON_CSV = 'stop_rec'
+    COL_NAME_ON_CSV_FMT = '%Y-%m-%d %H-%M-%S'
 
+    # process will be executed only if the time difference between the file in INPUT_DIR
+    # and the value in COL_TIME_ON_CSV is lower than
+    VALID_THRESH = 5 #s
+    # maximum number of files transferred at the same time
+    MAX_WORKERS = 4
+    # completed transfers, to continue if interrupted
+    JOURNAL_FILE = os.path.join(DEST_DIR, '_journal file renamer.jsonl')
+    # digests of the transferred files, to verify the copies and skip the ones already done
+    HASH_INDEX_FILE = os.path.join(DEST_DIR, '_hash index file renamer.json')
 
+    logging.debug('='*20)
+    logging.debug('moving from folder {} to folder {}'.format(INPUT_DIR, DEST_DIR))
+    plan, skipped = plan_from_csv(INPUT_DIR, DEST_DIR, CSV_FILE, COL_NAME_ON_CSV, COL_TIME_ON_CSV, 
+                                  COL_NAME_ON_CSV_FMT, LIST_EXT, VALID_THRESH)
+    results = execute_plan(plan, ACTION, MAX_WORKERS, JOURNAL_FILE, HASH_INDEX_FILE)
+    counter = sum(1 for r in results.values() if not isinstance(r, Exception))
+    logging.info('tot: {} files'.format(counter))
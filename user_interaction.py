@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import keyboard
 
 def chose_option_list(listOfOptions):
@@ -48,4 +49,22 @@ def chose_TF_keyboard(question = 'True or False?'):
         if ans == 'esc':
             return None
         else:
-            print('not valid input')
\ No newline at end of file
+            print('not valid input')
+
+#%% asyncio facade: the prompts wait for the answer on a thread of the default 
+# executor, so the event loop goes on meanwhile (the thread can't be interrupted 
+# while waiting for the input, cancelling the task only stops awaiting it)
+async def chose_option_list_async(listOfOptions):
+    '''Awaitable version of chose_option_list'''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, chose_option_list, listOfOptions)
+
+async def chose_TF_async(question = 'True or False?'):
+    '''Awaitable version of chose_TF'''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, chose_TF, question)
+
+async def chose_TF_keyboard_async(question = 'True or False?'):
+    '''Awaitable version of chose_TF_keyboard'''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, chose_TF_keyboard, question)
@@ -3,6 +3,20 @@ import csv
 import numpy as np
 import datetime
 import time
+import threading
+import atexit
+import io
+import queue
+import multiprocessing
+import collections
+import heapq
+import itertools
+import tempfile
+try:
+    import fcntl
+except ImportError: # windows
+    fcntl = None
+    import msvcrt
 
 def test_import():
     '''To simply test the import'''
@@ -14,32 +28,99 @@ def is_list(inp):
 def is_npArray(inp):
     return(isinstance(inp,np.ndarray))
 
+# kinds of input returned by classify_input
+INPUT_EMPTY = 'empty'           # [] or np.array with no elements
+INPUT_SCALAR = 'scalar'         # number, string, None, 0-d np.array
+INPUT_1D = '1D'                 # list of scalars or 1D np.array
+INPUT_ND = 'ND'                 # np.array with more than one dimension
+INPUT_LIST_OF_1D = 'listOf1D'   # list whose elements are all 1D lists or np.arrays
+INPUT_NESTED = 'nested'         # list whose elements are lists or np.arrays, at least one not 1D
+INPUT_OTHER = 'other'           # anything else (tuple, pandas objects, ...)
+INPUT_LIST_KINDS = (INPUT_LIST_OF_1D, INPUT_NESTED)
+
+def classify_input(inp):
+    '''
+    Classifies inp with a single pass over its elements, without comparing 
+    arrays, so that all the is_* and make_* helpers can be based on it.
+
+    Parameters
+    ----------
+    inp : any
+        input to be classified.
+
+    Returns
+    -------
+    tuple of 2 elements
+        kind : one of the INPUT_* values
+        elementsType : for INPUT_LIST_OF_1D and INPUT_NESTED, 
+        'list' if all the elements are lists, 'npArray' if all the elements 
+        are np.arrays, 'mixed' otherwise. None for the other kinds.
+    '''
+    if isinstance(inp, list):
+        if not inp:
+            return INPUT_EMPTY, None
+        allLists = True
+        allNpArrays = True
+        nested = False
+        for el in inp:
+            if isinstance(el, list):
+                allNpArrays = False
+                if el and isinstance(el[0], (list, np.ndarray)):
+                    nested = True
+            elif isinstance(el, np.ndarray):
+                allLists = False
+                if el.ndim > 1:
+                    nested = True
+            else:
+                # at least one scalar: it's a flat list
+                return INPUT_1D, None
+        if allLists:
+            elementsType = 'list'
+        elif allNpArrays:
+            elementsType = 'npArray'
+        else:
+            elementsType = 'mixed'
+        return (INPUT_NESTED if nested else INPUT_LIST_OF_1D), elementsType
+    if isinstance(inp, np.ndarray):
+        if inp.size == 0:
+            return INPUT_EMPTY, None
+        if inp.ndim == 0:
+            return INPUT_SCALAR, None
+        if inp.ndim == 1:
+            return INPUT_1D, None
+        return INPUT_ND, None
+    if inp is None or np.isscalar(inp):
+        return INPUT_SCALAR, None
+    return INPUT_OTHER, None
+
+def normalize_input(inp):
+    '''
+    Returns inp as a list whose elements are lists or np.arrays 
+    (inp itself if it's already like that, otherwise [inp]) and its kind 
+    (see classify_input)
+    '''
+    kind, elementsType = classify_input(inp)
+    if kind in INPUT_LIST_KINDS:
+        return inp, kind
+    return [inp], kind
+
 def is_listOfList(inp):
-    if inp == []:
-        return False
-    return is_list(inp) and all(isinstance(el, list) for el in inp)
+    kind, elementsType = classify_input(inp)
+    return kind in INPUT_LIST_KINDS and elementsType == 'list'
 
 def is_listOfNpArray(inp):
-    if inp == []:
-        return False
-    return is_list(inp) and all(isinstance(el, np.ndarray) for el in inp)
+    kind, elementsType = classify_input(inp)
+    return kind in INPUT_LIST_KINDS and elementsType == 'npArray'
 
 def is_list_containing_lists_or_npArray(inp):
-    if inp == []:
-        return False
-    return is_list(inp) and all(isinstance(el, list) or isinstance(el, np.ndarray) 
-                                  for el in inp)
+    return classify_input(inp)[0] in INPUT_LIST_KINDS
 
 def is_npArray_containing_npArray(inp):
-    return is_npArray(inp) and all(isinstance(el, np.ndarray) for el in inp)
+    return is_npArray(inp) and inp.ndim > 1
 
 def is_emptyList_or_emptyNpArray(inp):
-    if is_list(inp) and inp != []:
-        return False
-    elif is_npArray(inp) and np.any(inp):
-        return False
-    else:
-        return True
+    # everything that is not a list or a np.array with elements is considered empty
+    return classify_input(inp)[0] not in (INPUT_1D, INPUT_ND) + INPUT_LIST_KINDS
 
 def get_length(arrayOrScalar):
     if np.isscalar(arrayOrScalar):
@@ -66,11 +147,7 @@ def make_listOfNpArray(inp):
         return inp
 
 def make_listOfList_or_listOfNpArray(inp):
-    if not (is_listOfList(inp) or is_listOfNpArray(inp) or 
-            is_list_containing_lists_or_npArray(inp)):
-        return [inp]
-    else:
-        return inp
+    return normalize_input(inp)[0]
 
 def list_files_in_this_dir(directory):
     '''
@@ -435,60 +512,812 @@ def find_files_and_dirs_in_dir(directory, listDepth = [0], listExt = [''],
     
     return (valid_files, valid_dirs)
 
-def write_row_csv(CSVfile, newRow, mode = 'a'):
+def iter_files_in_these_dirs(listDirectories, limit = None):
+    '''
+    Same as list_files_in_these_dirs, but yields the complete path of each 
+    file as soon as it's found. If limit is specified, stops after limit files
+    '''
+    files = (os.path.join(directory, entry.name) 
+             for directory in make_list(listDirectories) 
+             for entry in _scandir(directory, isRoot = True) if entry.is_file())
+    return itertools.islice(files, limit)
+
+def iter_dirs_deep_this_dir(directory, maxDepth, limit = None):
+    '''
+    Same as list_dirs_deep_this_dir, but yields the complete path of each 
+    directory as soon as it's found (breadth first, the same order of the list). 
+    If limit is specified, stops after limit directories
+    '''
+    return itertools.islice(_iter_dirs_deep(directory, maxDepth), limit)
+
+def _scandir(directory, isRoot = False):
+    # like os.scandir, but the entries are consumed and the folder closed immediately. 
+    # A missing or unreadable subdirectory (ex. removed while searching) is skipped, 
+    # while the errors of a root directory are raised, as in the list functions
+    try:
+        with os.scandir(directory) as it:
+            return list(it)
+    except (PermissionError, FileNotFoundError):
+        if isRoot:
+            raise
+        return []
+
+def _iter_dirs_deep(directory, maxDepth):
+    # same depth convention of list_dirs_deep_this_dir: maxDepth+1 levels, -1 for all
+    searchDirs = collections.deque((d, 0) for d in make_list(directory))
+    while searchDirs:
+        searchDir, depth = searchDirs.popleft()
+        for entry in _scandir(searchDir, isRoot = depth == 0):
+            if entry.is_dir():
+                path = os.path.join(searchDir, entry.name)
+                yield path
+                if maxDepth == -1 or depth <= maxDepth:
+                    searchDirs.append((path, depth+1))
+
+def _is_partial_name_valid(path, listPartialName, logic):
+    if logic == 'AND':
+        return all(partialName in path for partialName in listPartialName)
+    return any(partialName in path for partialName in listPartialName)
+
+def _external_sorted(paths, bufferSize, reverse = False):
+    '''
+    Yields paths sorted, keeping in memory at most bufferSize paths: 
+    sorted runs of bufferSize paths are written in temporary files and 
+    merged at the end
+    '''
+    runs = []
+    try:
+        while True:
+            chunk = sorted(itertools.islice(paths, bufferSize), reverse = reverse)
+            if len(chunk) < bufferSize and not runs:
+                # everything fits in memory
+                yield from chunk
+                return
+            if chunk:
+                run = tempfile.TemporaryFile('w+', encoding = 'UTF8')
+                run.writelines(path + '\n' for path in chunk)
+                run.seek(0)
+                runs.append(run)
+            if len(chunk) < bufferSize:
+                break
+        lines = [(line[:-1] for line in run) for run in runs]
+        yield from heapq.merge(*lines, reverse = reverse)
+    finally:
+        for run in runs:
+            run.close()
+
+def iter_files_and_dirs_in_dir(directory, listDepth = [0], listExt = [''], 
+    listPartialName = [''], filterPartNameLogic = 'AND', onlyDirs = False, 
+    onlyFiles = False, limit = None, sortOutput = 0, sortBufferSize = 100000):
+    '''
+    Lazy version of find_files_and_dirs_in_dir: yields the complete path of 
+    every valid file and directory as soon as it's found, so that the 
+    processing can start on the first one while the search goes on.
+
+    The depth of each path is given by the position in the tree (not by the 
+    number of separators in the path). The filters have the same meaning 
+    of find_files_and_dirs_in_dir.
+
+    Parameters
+    ----------
+    directory : string
+        complete path of the main directory
+    listDepth : list, optional
+        see find_files_and_dirs_in_dir, by default [0]
+    listExt : list, optional
+        see find_files_and_dirs_in_dir, by default ['']
+    listPartialName : list, optional
+        see find_files_and_dirs_in_dir, by default ['']
+    filterPartNameLogic : str, optional
+        see find_files_and_dirs_in_dir, by default 'AND'
+    onlyDirs : bool, optional
+        If True, only directories are yielded, by default False
+    onlyFiles : bool, optional
+        If True, only files are yielded, by default False
+    limit : int, optional
+        maximum number of yielded paths, by default None (no limit)
+    sortOutput : int, optional
+        If 0, the paths are yielded in the order they are found
+        If 1, the paths are yielded sorted
+        If -1, the paths are yielded sorted in reverse
+        Sorting needs the whole search to be completed before yielding 
+        the first path, by default 0
+    sortBufferSize : int, optional
+        when sorting, maximum number of paths kept in memory, the others 
+        are sorted in temporary files and merged, by default 100000
+
+    Yields
+    ------
+    string
+        complete path of each valid file or directory
+    '''
+    assert filterPartNameLogic in ['AND', 'OR'], \
+        f"filterPartNameLogic should be AND or OR, got: {filterPartNameLogic}"
+    listDepth = make_list(listDepth)
+    listExt = tuple(make_list(listExt))
+    listPartialName = make_list(listPartialName)
+
+    paths = _iter_valid_paths(directory, listDepth, listExt, listPartialName, 
+                              filterPartNameLogic, not onlyFiles, not onlyDirs)
+    if sortOutput in [1, -1]:
+        paths = _external_sorted(paths, sortBufferSize, reverse = sortOutput == -1)
+    return itertools.islice(paths, limit)
+
+def _iter_valid_paths(directory, listDepth, listExt, listPartialName, logic, 
+                      searchDirs, searchFiles):
+    allDepths = listDepth == [-1]
+    maxDepth = max(listDepth)
+    # depth of the entries of the main directory is 0
+    toVisit = collections.deque([(directory, 0)])
+    while toVisit:
+        thisDir, depth = toVisit.popleft()
+        validDepth = allDepths or depth in listDepth
+        for entry in _scandir(thisDir, isRoot = depth == 0):
+            path = os.path.join(thisDir, entry.name)
+            if entry.is_dir():
+                if searchDirs and validDepth and \
+                    _is_partial_name_valid(path, listPartialName, logic):
+                    yield path
+                if allDepths or depth < maxDepth:
+                    toVisit.append((path, depth+1))
+            elif searchFiles and validDepth and path.endswith(listExt) and \
+                _is_partial_name_valid(path, listPartialName, logic):
+                yield path
+
+def find_first_in_dir(directory, **kwargs):
+    '''
+    Returns the first path found by iter_files_and_dirs_in_dir with the 
+    given arguments, None if nothing is found. The search stops at the first match
+
+    ex: find_first_in_dir(directory, listDepth = -1, listExt = '.csv', onlyFiles = True)
+    '''
+    return next(iter_files_and_dirs_in_dir(directory, limit = 1, **kwargs), None)
+
+def lock_file(f, pollInterval = 0.001):
+    '''
+    Acquires an exclusive advisory lock on the open file f, waiting until 
+    it's available. Release it with unlock_file
+    '''
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    # on windows the first byte of the file is used as lock
+    while True:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            f.seek(0, os.SEEK_END)
+            return
+        except OSError:
+            time.sleep(pollInterval)
+
+def unlock_file(f):
+    '''Releases the lock acquired with lock_file'''
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        return
+    f.seek(0)
+    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    f.seek(0, os.SEEK_END)
+
+class CsvAppender:
+    '''
+    Long-lived csv writer that keeps the file open and buffers the rows.
+
+    Rows are written to the file when bufferSize rows are waiting, when 
+    flushInterval seconds have passed since the last write, when flush() is 
+    called and when the appender is closed (also at interpreter exit).
+    If background is True, the writing is done by a separate thread, 
+    so that writerow() only appends the row to the buffer.
+
+    Can be used as a context manager:
+    with CsvAppender(CSVfile) as appender:
+        for row in rows:
+            appender.writerow(row)
+
+    Parameters
+    ----------
+    CSVfile : string
+        complete path to the csv file.
+    mode : string, optional
+        mode used to open the file. The default is 'a'.
+    bufferSize : int, optional
+        number of rows kept in memory before writing them. The default is 1000.
+    flushInterval : float, optional
+        maximum time [s] the rows are kept in memory before writing them. 
+        The default is 1.
+    background : bool, optional
+        if True, the rows are written by a background thread. 
+        The default is False.
+    lockFile : bool, optional
+        if True, every batch of rows is written with a single write while 
+        holding an advisory lock on the file, so that other processes 
+        appending to the same file (with lockFile = True) can't interleave 
+        their rows. The default is False.
+    '''
+
+    def __init__(self, CSVfile, mode = 'a', bufferSize = 1000, flushInterval = 1.0, 
+                 background = False, lockFile = False):
+        self.CSVfile = CSVfile
+        self.bufferSize = max(1, int(bufferSize))
+        self.flushInterval = flushInterval
+        self.background = background
+        self.lockFile = lockFile
+
+        # eventually create the csv folder
+        folder = os.path.split(CSVfile)[0]
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+        self._file = open(CSVfile, mode, encoding='UTF8', newline='')
+        self._writer = csv.writer(self._file)
+
+        self._rows = []
+        self._lastFlush = time.monotonic()
+        self._bufferLock = threading.Lock()
+        self._fileLock = threading.Lock()
+        self._closed = False
+
+        self._thread = None
+        if self.background:
+            self._wake = threading.Event()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target = self._run, daemon = True)
+            self._thread.start()
+        # rows still in the buffer are written if the appender is never closed
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def writerow(self, newRow):
+        '''Adds newRow to the buffer, writes the buffer if a threshold is reached'''
+        if self._closed:
+            raise ValueError('CsvAppender of {} is closed'.format(self.CSVfile))
+        with self._bufferLock:
+            self._rows.append(newRow)
+            nRows = len(self._rows)
+        self._check_thresholds(nRows)
+
+    def writerows(self, rows):
+        '''Adds all the rows to the buffer, writes the buffer if a threshold is reached'''
+        if self._closed:
+            raise ValueError('CsvAppender of {} is closed'.format(self.CSVfile))
+        with self._bufferLock:
+            self._rows.extend(rows)
+            nRows = len(self._rows)
+        self._check_thresholds(nRows)
+
+    def flush(self):
+        '''Writes all the rows in the buffer to the file'''
+        with self._bufferLock:
+            rows, self._rows = self._rows, []
+        with self._fileLock:
+            if rows and not self._file.closed:
+                if self.lockFile:
+                    # format the whole batch first, then write it at once
+                    text = io.StringIO()
+                    csv.writer(text).writerows(rows)
+                    lock_file(self._file)
+                    try:
+                        self._file.write(text.getvalue())
+                        self._file.flush()
+                    finally:
+                        unlock_file(self._file)
+                else:
+                    self._writer.writerows(rows)
+                    self._file.flush()
+            self._lastFlush = time.monotonic()
+
+    def close(self):
+        '''Writes the remaining rows and closes the file'''
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+        self.flush()
+        with self._fileLock:
+            self._file.close()
+
+    def _check_thresholds(self, nRows):
+        full = nRows >= self.bufferSize
+        expired = time.monotonic() - self._lastFlush >= self.flushInterval
+        if not (full or expired):
+            return
+        if self.background:
+            self._wake.set()
+        else:
+            self.flush()
+
+    def _run(self):
+        # wakes up when the buffer is full or every flushInterval seconds
+        while not self._stop.is_set():
+            self._wake.wait(self.flushInterval)
+            self._wake.clear()
+            self.flush()
+
+def _csv_queue_writer_loop(CSVfile, rowsQueue, mode, bufferSize, flushInterval, lockFile):
+    with CsvAppender(CSVfile, mode, bufferSize, flushInterval, lockFile = lockFile) as appender:
+        while True:
+            try:
+                rows = rowsQueue.get(timeout = flushInterval)
+            except queue.Empty:
+                appender.flush()
+                continue
+            if rows is None: # sentinel sent by close()
+                break
+            appender.writerows(rows)
+
+class CsvQueueWriter:
+    '''
+    Single writer process that receives rows from a multiprocessing queue 
+    and appends them to the csv file specified in CSVfile, 
+    so that many workers can log to the same file without interleaving rows.
+
+    The writer can be passed to the worker processes as argument of 
+    multiprocessing.Process (the queue is inherited), then the workers use 
+    writerow/writerows. Rows are written in batches by a CsvAppender.
+
+    with CsvQueueWriter(CSVfile) as writer:
+        workers = [multiprocessing.Process(target = work, args = (writer,)) for _ in range(8)]
+        ...
+
+    Parameters
+    ----------
+    CSVfile : string
+        complete path to the csv file.
+    mode : string, optional
+        mode used to open the file. The default is 'a'.
+    bufferSize : int, optional
+        see CsvAppender. The default is 1000.
+    flushInterval : float, optional
+        see CsvAppender. The default is 1.
+    lockFile : bool, optional
+        see CsvAppender, needed only if other processes append to the same 
+        file without passing through this writer. The default is False.
+    start : bool, optional
+        automatically start the writer process. The default is True.
+    '''
+
+    def __init__(self, CSVfile, mode = 'a', bufferSize = 1000, flushInterval = 1.0, 
+                 lockFile = False, start = True):
+        self.CSVfile = CSVfile
+        self.queue = multiprocessing.Queue()
+        self._process = multiprocessing.Process(target = _csv_queue_writer_loop, 
+            args = (CSVfile, self.queue, mode, bufferSize, flushInterval, lockFile), 
+            daemon = True)
+        if start:
+            self.start()
+
+    def __getstate__(self):
+        # the process can't be sent to the workers, only the queue is needed
+        state = self.__dict__.copy()
+        state['_process'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        '''Starts the writer process'''
+        self._process.start()
+
+    def writerow(self, newRow):
+        '''Sends newRow to the writer process'''
+        self.queue.put([newRow])
+
+    def writerows(self, rows):
+        '''Sends all the rows to the writer process at once'''
+        self.queue.put(list(rows))
+
+    def close(self):
+        '''Waits for all the rows to be written and stops the writer process'''
+        if self._process is None:
+            raise Exception('CsvQueueWriter can be closed only by the process that created it')
+        if self._process.is_alive():
+            self.queue.put(None)
+            self._process.join()
+
+def _write_rows_now(CSVfile, rows, mode, lockFile):
+    # opens, writes and closes the file directly, without buffering
+    # eventually create the csv folder
+    folder = os.path.split(CSVfile)[0]
+    if folder:
+        os.makedirs(folder, exist_ok = True)
+    with open(CSVfile, mode, encoding='UTF8', newline='') as f:
+        if lockFile:
+            lock_file(f)
+        try:
+            csv.writer(f).writerows(rows)
+            f.flush()
+        finally:
+            if lockFile:
+                unlock_file(f)
+
+def write_row_csv(CSVfile, newRow, mode = 'a', lockFile = False):
     '''
     Writes newRow in the csv file specified in CSVfile
 
+    To write many rows over time, use a CsvAppender instead, which keeps 
+    the file open between the calls.
+
     Parameters
     ----------
     CSVfile : string
         complete path to the csv file.
     newRow : list
         row to be added.
+    lockFile : bool, optional
+        if True, holds an advisory lock on the file while writing, 
+        see CsvAppender. The default is False.
 
     Returns
     -------
     None.
 
     '''
-    # eventually create the csv folder
-    os.makedirs(os.path.split(CSVfile)[0], exist_ok= True)
-    f = open(CSVfile, mode, encoding='UTF8', newline='')
-    writer = csv.writer(f)
-    writer.writerow(newRow)
-    f.close()
+    _write_rows_now(CSVfile, [newRow], mode, lockFile)
 
-def write_rows_csv(CSVfile, rows, mode = 'a'):
+def write_rows_csv(CSVfile, rows, mode = 'a', lockFile = False):
     '''
-    Writes newRow in the csv file specified in CSVfile
+    Writes rows in the csv file specified in CSVfile
 
     Parameters
     ----------
     CSVfile : string
         complete path to the csv file.
-    newRow : list
-        row to be added.
+    rows : list of lists
+        rows to be added.
+    lockFile : bool, optional
+        if True, holds an advisory lock on the file while writing, 
+        see CsvAppender. The default is False.
 
     Returns
     -------
     None.
 
     '''
-    # eventually create the csv folder
-    os.makedirs(os.path.split(CSVfile)[0], exist_ok= True)
-    f = open(CSVfile, mode, encoding='UTF8', newline='')
-    writer = csv.writer(f)
-    writer.writerows(rows)
-    f.close()
-    
-        
-def this_moment(fmt = '%Y-%m-%d %H-%M-%S'):
-    return datetime.datetime.fromtimestamp(time.time()).strftime(fmt)
-<<<<<<< HEAD
-=======
+    _write_rows_now(CSVfile, rows, mode, lockFile)
+
+def _as_2d_array(data):
+    # DataFrames are converted to their values, Series and 1D arrays to a single column
+    if hasattr(data, 'to_frame') and not hasattr(data, 'columns'):
+        data = data.to_frame()
+    if hasattr(data, 'to_numpy') and hasattr(data, 'columns'):
+        return data.to_numpy(), [str(c) for c in data.columns]
+    data = np.asarray(data)
+    if data.ndim == 1:
+        data = data[:, np.newaxis]
+    return data, None
+
+def _is_list_of_rows(data):
+    # list of scalars (one column) or list of lists of scalars (rows)
+    if not isinstance(data, (list, tuple)):
+        return False
+    if len(data) == 0 or np.ndim(data[0]) == 0:
+        return True
+    return isinstance(data[0], (list, tuple)) and all(np.ndim(v) == 0 for v in data[0])
+
+def _iter_chunks(data):
+    # a single array/DataFrame/Series or a list of rows is one chunk, 
+    # otherwise data is an iterable of chunks (ex. generator or list of arrays)
+    if isinstance(data, np.ndarray) or hasattr(data, 'to_frame') or hasattr(data, 'columns') \
+        or _is_list_of_rows(data):
+        yield data
+    else:
+        yield from data
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.feather
+    except ImportError:
+        raise ImportError('pyarrow is needed to read and write .parquet and .feather files')
+    return pyarrow
+
+def write_array_csv(CSVfile, data, header = None, mode = 'a', fmt = '%r', 
+                    delimiter = ',', batchRows = 10000):
+    '''
+    Writes a 2D np.array, a DataFrame (or a Series, as one column) or a list 
+    of rows in the csv file specified in CSVfile.
+    The values are formatted batchRows rows at once instead of row by row, 
+    so it's much faster than write_rows_csv for big numerical arrays, without 
+    creating the text of the whole array in memory.
 
->>>>>>> 5e81ac512be0f5069af28b5956a5080ae6087373
+    data can also be an iterable of chunks (ex. a generator or a list of 
+    np.arrays or DataFrames with the same number of columns), which are 
+    written one after the other without keeping all of them in memory.
 
+    Parameters
+    ----------
+    CSVfile : string
+        complete path to the csv file.
+    data : np.array, DataFrame, Series, list of rows or iterable of them
+        values to be written, one row of the array is one row of the csv.
+    header : list, optional
+        names of the columns, written before the first chunk. 
+        The default is None, which uses the columns of the DataFrame if any.
+    mode : string, optional
+        mode used to open the file. The default is 'a'.
+    fmt : string, optional
+        format of each value. The default is '%r', the shortest 
+        representation that reads back to the same value in the type of the 
+        array (the same written by write_rows_csv, also for float32).
+    delimiter : string, optional
+        The default is ','.
+    batchRows : int, optional
+        number of rows formatted at once. The default is 10000.
 
+    Returns
+    -------
+    None.
 
-    
+    '''
+    folder = os.path.split(CSVfile)[0]
+    if folder:
+        os.makedirs(folder, exist_ok = True)
+    with open(CSVfile, mode, encoding='UTF8', newline='') as f:
+        firstChunk = True
+        for chunk in _iter_chunks(data):
+            values, columns = _as_2d_array(chunk)
+            if firstChunk:
+                header = header if header is not None else columns
+                if header is not None:
+                    f.write(delimiter.join(str(h) for h in header) + '\n')
+                firstChunk = False
+            if values.size == 0:
+                continue
+            if values.dtype.kind in 'fiub':
+                valueFmt = fmt
+                if fmt == '%r' and values.dtype.kind == 'f' and values.dtype.itemsize < 8:
+                    # shortest text of the float32 itself, not of its conversion to float64
+                    valueFmt = '%s'
+                    toText = lambda batch: batch.astype(str).ravel().tolist()
+                else:
+                    toText = lambda batch: batch.ravel().tolist()
+                # one format string for each batch of rows
+                rowFmt = delimiter.join([valueFmt] * values.shape[1])
+                for start in range(0, values.shape[0], batchRows):
+                    batch = values[start:start+batchRows]
+                    batchFmt = '\n'.join([rowFmt] * batch.shape[0]) + '\n'
+                    f.write(batchFmt % tuple(toText(batch)))
+            else:
+                csv.writer(f, delimiter = delimiter).writerows(values.tolist())
+
+class ColumnarWriter:
+    '''
+    Writes chunks of a 2D array (or DataFrame) in a binary columnar file, 
+    without keeping all the chunks in memory.
+    The format is given by the extension of the file:
+    - .npy: numpy file, can be read back with np.load(mmap_mode = 'r')
+    - .parquet and .feather: need pyarrow, keep the names of the columns
+    - .csv: uses write_array_csv
+
+    The type of the file is the one of the first chunk: the following chunks 
+    are converted to it if possible without losing data (ex. int to float), 
+    otherwise an AssertionError is raised.
+
+    Can be used as a context manager:
+    with ColumnarWriter(file) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    Parameters
+    ----------
+    file : string
+        complete path to the file.
+    columns : list, optional
+        names of the columns. The default is None, which uses the columns of 
+        the first DataFrame or 'c0', 'c1', ... 
+    '''
+
+    # bytes reserved for the .npy header, rewritten with the final shape on close
+    NPY_HEADER_LEN = 128
+    VALID_EXTENSIONS = ['.npy', '.parquet', '.feather', '.csv']
+
+    def __init__(self, file, columns = None):
+        self.file = file
+        self.columns = columns
+        self.extension = get_extension(file).lower()
+        assert self.extension in self.VALID_EXTENSIONS, \
+            f"extension not valid, possible values are: {self.VALID_EXTENSIONS}"
+        folder = os.path.split(file)[0]
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+        self.nRows = 0
+        self._dtype = None
+        self._nCols = None
+        self._file = None
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, chunk):
+        '''Appends chunk (2D np.array or DataFrame) to the file'''
+        values, columns = _as_2d_array(chunk)
+        if self._nCols is None:
+            self._nCols = values.shape[1]
+            if self.columns is None:
+                self.columns = columns or ['c{}'.format(i) for i in range(self._nCols)]
+            self._open(values)
+        assert values.shape[1] == self._nCols, \
+            f"all the chunks should have {self._nCols} columns, got {values.shape[1]}"
+        if self.extension != '.csv':
+            # the type of the file is given by the first chunk: only safe casts are accepted
+            assert np.can_cast(values.dtype, self._dtype, casting = 'safe'), \
+                f"a chunk of type {values.dtype} can't be stored in a file of type {self._dtype} " \
+                "without losing data, convert the first chunk to a wider type"
+            values = values.astype(self._dtype, copy = False)
+
+        if self.extension == '.npy':
+            values = np.ascontiguousarray(values, dtype = self._dtype)
+            self._file.write(values.tobytes())
+        elif self.extension == '.csv':
+            write_array_csv(self.file, values, mode = 'a')
+        else:
+            pa = _import_pyarrow()
+            table = pa.table({c: values[:, i] for i, c in enumerate(self.columns)})
+            self._writer.write_table(table)
+        self.nRows += values.shape[0]
+
+    def close(self):
+        '''Finalises and closes the file'''
+        if self.extension == '.npy' and self._file is not None:
+            self._file.seek(0)
+            self._file.write(self._npy_header((self.nRows, self._nCols)))
+            self._file.close()
+            self._file = None
+        elif self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _open(self, values):
+        assert self.extension == '.csv' or values.dtype != object, \
+            f"values of type object (ex. strings) can't be written in {self.extension} files, use .csv"
+        self._dtype = values.dtype
+        if self.extension == '.npy':
+            self._file = open(self.file, 'wb')
+            self._file.write(self._npy_header((0, self._nCols)))
+        elif self.extension == '.csv':
+            write_array_csv(self.file, values[:0], header = self.columns, mode = 'w')
+        else:
+            pa = _import_pyarrow()
+            schema = pa.schema([(c, pa.from_numpy_dtype(self._dtype)) for c in self.columns])
+            if self.extension == '.parquet':
+                self._writer = pa.parquet.ParquetWriter(self.file, schema)
+            else:
+                self._writer = pa.ipc.new_file(self.file, schema)
+
+    def _npy_header(self, shape):
+        header = repr({'descr': np.lib.format.dtype_to_descr(self._dtype), 
+                       'fortran_order': False, 'shape': shape})
+        header = header.ljust(self.NPY_HEADER_LEN - 10 - 1) + '\n'
+        return (b'\x93NUMPY\x01\x00' + 
+                np.uint16(len(header)).tobytes() + header.encode('latin1'))
+
+def write_columns(file, data, columns = None):
+    '''
+    Writes a 2D np.array, a DataFrame or an iterable of chunks of them in a 
+    columnar file, see ColumnarWriter for the possible formats
+
+    Parameters
+    ----------
+    file : string
+        complete path to the file.
+    data : np.array, DataFrame or iterable of them
+        values to be written.
+    columns : list, optional
+        names of the columns. The default is None.
+
+    Returns
+    -------
+    int
+        number of rows written.
+
+    '''
+    with ColumnarWriter(file, columns) as writer:
+        for chunk in _iter_chunks(data):
+            writer.write(chunk)
+    return writer.nRows
+
+def read_columns(file, columns = None, chunkSize = None):
+    '''
+    Reads a file written with write_columns or ColumnarWriter.
+
+    .npy files are memory-mapped, so only the parts actually used are read 
+    from the disk.
+
+    Parameters
+    ----------
+    file : string
+        complete path to the file.
+    columns : list, optional
+        names (or indexes for .npy) of the columns to be read. 
+        The default is None, which reads all of them.
+    chunkSize : int, optional
+        if specified, returns a generator of chunks of chunkSize rows.
+        The default is None, which returns all the rows at once.
+
+    Returns
+    -------
+    np.array (.npy) or DataFrame (other formats), or generator of them
+    '''
+    extension = get_extension(file).lower()
+    if chunkSize is not None:
+        return _read_columns_chunks(file, extension, columns, chunkSize)
+    if extension == '.npy':
+        values = np.load(file, mmap_mode = 'r')
+        return values if columns is None else values[:, columns]
+    elif extension == '.csv':
+        import pandas as pd
+        return pd.read_csv(file, usecols = columns)
+    pa = _import_pyarrow()
+    if extension == '.parquet':
+        return pa.parquet.read_table(file, columns = columns).to_pandas()
+    elif extension == '.feather':
+        return pa.feather.read_table(file, columns = columns, memory_map = True).to_pandas()
+    raise Exception('extension not valid for read_columns, got {}'.format(extension))
+
+def _read_columns_chunks(file, extension, columns, chunkSize):
+    if extension == '.npy':
+        values = np.load(file, mmap_mode = 'r')
+        if columns is not None:
+            columns = make_list(columns)
+        for start in range(0, values.shape[0], chunkSize):
+            chunk = values[start:start+chunkSize]
+            yield np.array(chunk if columns is None else chunk[:, columns])
+    elif extension == '.csv':
+        import pandas as pd
+        yield from pd.read_csv(file, usecols = columns, chunksize = chunkSize)
+    elif extension == '.parquet':
+        pa = _import_pyarrow()
+        parquetFile = pa.parquet.ParquetFile(file)
+        for batch in parquetFile.iter_batches(batch_size = chunkSize, columns = columns):
+            yield batch.to_pandas()
+    elif extension == '.feather':
+        pa = _import_pyarrow()
+        table = pa.feather.read_table(file, columns = columns, memory_map = True)
+        # slices (without copy) instead of the batches of the file, so all the 
+        # chunks have chunkSize rows
+        for start in range(0, table.num_rows, chunkSize):
+            yield table.slice(start, chunkSize).to_pandas()
+    else:
+        raise Exception('extension not valid for read_columns, got {}'.format(extension))
+
+def this_moment(fmt = '%Y-%m-%d %H-%M-%S'):
+    return datetime.datetime.fromtimestamp(time.time()).strftime(fmt)
+
+#%% micro-benchmark of the input helpers
+if __name__ == '__main__':
+    import timeit
+
+    x = np.arange(0, 10000, 1.)
+    inputs = {'scalar': 1., '1D list': list(range(100)), '1D np.array': x, 
+              'list of np.array': [x]*10, 'list of list': [[1, 2, 3]]*10, 
+              'nested': [x, [x, x]]}
+    helpers = [classify_input, is_listOfList, is_listOfNpArray, 
+               is_emptyList_or_emptyNpArray, make_listOfList_or_listOfNpArray]
+    nCalls = 10000
+    for name, inp in inputs.items():
+        print(name)
+        for helper in helpers:
+            t = timeit.timeit(lambda: helper(inp), number = nCalls)
+            print('    {:35s} {:8.3f} us/call'.format(helper.__name__, t/nCalls*1e6))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Fast reading of the metadata of MP4/MOV videos (duration, timescale,
+creation time, frames, fps, size) from the atoms of the container, without
+initialising a decoder. OpenCV is used as fallback for other containers.
+"""
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+# seconds between 1904-01-01 (mp4 epoch) and 1970-01-01 (unix epoch)
+MP4_EPOCH_OFFSET = 2082844800
+MP4_EXTENSIONS = ['.mp4', '.mov', '.m4v', '.m4a', '.3gp']
+# atoms containing other atoms, the only ones parsed inside moov
+_CONTAINER_ATOMS = {b'moov', b'trak', b'mdia', b'minf', b'stbl'}
+
+class ProbeError(Exception):
+    """A custom exception used to report that the metadata can't be read"""
+
+def _iter_atoms(data, start = 0, end = None):
+    # yields (type, start of the content, end of the atom) of the atoms in data[start:end]
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, pos+8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            raise ProbeError('invalid atom size')
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+def _find_moov(f):
+    # reads only the atom headers until moov, skipping mdat without reading it
+    fileSize = os.fstat(f.fileno()).st_size
+    pos = 0
+    while pos + 8 <= fileSize:
+        f.seek(pos)
+        header = f.read(16)
+        size, kind = struct.unpack_from('>I4s', header)
+        headerSize = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', header, 8)[0]
+            headerSize = 16
+        elif size == 0:
+            size = fileSize - pos
+        if size < headerSize:
+            raise ProbeError('invalid atom size')
+        if kind == b'moov':
+            f.seek(pos + headerSize)
+            return f.read(size - headerSize)
+        pos += size
+    raise ProbeError('moov atom not found')
+
+def _read_times(data, start):
+    # creation time, timescale and duration of mvhd and mdhd (version 0 or 1)
+    version = data[start]
+    if version == 1:
+        creation, _, timescale, duration = struct.unpack_from('>QQIQ', data, start+4)
+    else:
+        creation, _, timescale, duration = struct.unpack_from('>IIII', data, start+4)
+    return creation, timescale, duration
+
+def _parse_moov(moov):
+    info = {}
+    tracks = []
+
+    def walk(start, end, track):
+        for kind, s, e in _iter_atoms(moov, start, end):
+            if kind == b'mvhd':
+                creation, timescale, duration = _read_times(moov, s)
+                info['timescale'] = timescale
+                info['duration'] = duration / timescale if timescale else None
+                info['creation_time'] = creation - MP4_EPOCH_OFFSET if creation else None
+            elif kind == b'trak':
+                track = {}
+                tracks.append(track)
+                walk(s, e, track)
+            elif kind == b'tkhd' and track is not None:
+                # width and height are the last 8 bytes, 16.16 fixed point
+                width, height = struct.unpack_from('>II', moov, e-8)
+                track['width'] = width / 65536
+                track['height'] = height / 65536
+            elif kind == b'mdhd' and track is not None:
+                _, track['timescale'], track['duration'] = _read_times(moov, s)
+            elif kind == b'hdlr' and track is not None:
+                track['handler'] = moov[s+8:s+12]
+            elif kind == b'stsz' and track is not None:
+                track['frame_count'] = struct.unpack_from('>I', moov, s+8)[0]
+            elif kind in _CONTAINER_ATOMS:
+                walk(s, e, track)
+
+    walk(0, len(moov), None)
+    if 'timescale' not in info:
+        raise ProbeError('mvhd atom not found')
+
+    video = next((t for t in tracks if t.get('handler') == b'vide'), None)
+    if video is not None:
+        info['frame_count'] = video.get('frame_count')
+        info['width'] = video.get('width')
+        info['height'] = video.get('height')
+        if video.get('timescale') and video.get('duration') and video.get('frame_count'):
+            info['fps'] = video['frame_count'] / (video['duration'] / video['timescale'])
+    return info
+
+def probe_mp4(path):
+    '''
+    Reads the metadata of a MP4/MOV file from its atoms (only the moov atom
+    is read, the media data is skipped).
+
+    Parameters
+    ----------
+    path : string
+        complete path to the video.
+
+    Returns
+    -------
+    dict
+        duration [s], timescale [units per s], creation_time [unix timestamp,
+        None if not set], and for the first video track: frame_count, fps,
+        width, height (None if missing).
+
+    '''
+    with open(path, 'rb') as f:
+        info = _parse_moov(_find_moov(f))
+    for key in ['frame_count', 'fps', 'width', 'height']:
+        info.setdefault(key, None)
+    info['source'] = 'mp4'
+    return info
+
+def probe_opencv(path):
+    '''
+    Same as probe_mp4, but opening the video with OpenCV (works with every
+    container supported by OpenCV, but initialises the decoder)
+    '''
+    import cv2
+    video = cv2.VideoCapture(path)
+    if not video.isOpened():
+        raise ProbeError('OpenCV could not open {}'.format(path))
+    try:
+        fps = video.get(cv2.CAP_PROP_FPS)
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        info = dict(duration = frame_count / fps if fps else None, timescale = None,
+                    creation_time = None, frame_count = frame_count, fps = fps,
+                    width = video.get(cv2.CAP_PROP_FRAME_WIDTH),
+                    height = video.get(cv2.CAP_PROP_FRAME_HEIGHT), source = 'opencv')
+    finally:
+        video.release()
+    return info
+
+def probe_video(path, fallback = True):
+    '''
+    Metadata of the video in path (see probe_mp4): MP4/MOV files are parsed
+    directly, the other ones (or if the parsing fails) are opened with
+    OpenCV if fallback is True
+    '''
+    if os.path.splitext(path)[-1].lower() in MP4_EXTENSIONS:
+        try:
+            return probe_mp4(path)
+        except (ProbeError, struct.error):
+            if not fallback:
+                raise
+    elif not fallback:
+        raise ProbeError('not a MP4/MOV file: {}'.format(path))
+    return probe_opencv(path)
+
+def probe_videos(paths, fallback = True, maxWorkers = 8):
+    '''
+    Metadata of many videos (see probe_video), probed in parallel by
+    maxWorkers threads. Returns a dictionary {path: metadata}, the metadata
+    is the exception raised if the video couldn't be probed. paths can also 
+    be a generator (ex. utils.iter_files_and_dirs_in_dir)
+    '''
+    # the paths are used twice (map and zip), so a generator is consumed only once
+    paths = list(paths)
+    def safe_probe(path):
+        try:
+            return probe_video(path, fallback)
+        except Exception as e:
+            return e
+    with ThreadPoolExecutor(max_workers = maxWorkers) as executor:
+        return dict(zip(paths, executor.map(safe_probe, paths)))